@@ -1,3 +1,3 @@
-from .primefield import PrimeField
+from .primefield import PrimeField, FpVector, Fp2
 from .mont import MontgomeryCurve
 from .isogeny import MontgomeryIsogeny
\ No newline at end of file
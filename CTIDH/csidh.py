@@ -2,9 +2,9 @@ from copy import deepcopy
 
 from CTIDH.isogeny import MontgomeryIsogeny
 from CTIDH.mont import MontgomeryCurve
-from CTIDH.utils import read_prime_info, read_prime_info_for_tvelu_test
+from CTIDH.utils import read_prime_info, read_prime_info_for_tvelu_test, VerdictCache
 
-from CTIDH.utils import get_randint, CMOV, CSWAP, sign
+from CTIDH.utils import get_randint, cmov, cswap, sign
 
 
 class CSIDH:
@@ -18,6 +18,13 @@ class CSIDH:
         verbose=True,
         uninitialized=False,
         validation="original",
+        backend="sage",  # field backend, see PrimeField(). "gmpy2" runs without Sage
+        counting=True,  # count Fp-operations? Only the gmpy2 backend can switch it off
+        PRAC=False,  # use PRAC chains for the public scalar mults? Takes precedence over SDAC for them
+        elligator_table=False,  # draw the Elligator u from the precomputed table of MontgomeryCurve? (CTIDH software)
+        verdict_cache=0,  # remember this many is_supersingular verdicts (LRU), 0 to validate every time
+        verdict_ttl=None,  # seconds a cached verdict stays valid, None for ever
+        verdict_store=None,  # file keeping the verdicts across restarts, see VerdictCache
     ):
         # Check parameters
         if formula_name not in ["tvelu", "svelu", "hvelu"]:
@@ -28,17 +35,27 @@ class CSIDH:
         self.prime_name = prime_name
         self.formula_name = formula_name
         self.SDAC = SDAC
+        self.PRAC = PRAC
         self.tuned = tuned
         self.scaled = scaled
         self.uninitialized = uninitialized
         self.verbose = verbose
         self.validation = validation
-
-        self.curve = MontgomeryCurve(prime_name, SDAC, validation)
+        self.backend = backend
+        self.counting = counting
+        self.elligator_table = elligator_table
+        self.verdict_cache = None
+        if verdict_cache:
+            self.verdict_cache = VerdictCache(verdict_cache, verdict_ttl, verdict_store)
+        elif verdict_store is not None:
+            raise ValueError("verdict_store needs verdict_cache > 0")
+
+        self.curve = MontgomeryCurve(prime_name, SDAC, validation, backend, counting, PRAC)
         self.isogeny = MontgomeryIsogeny(formula_name, uninitialized)(
             self.curve, self.tuned, self.scaled
         )
         self.field = self.curve.field
+        self.elligator = self.curve.elligator_table if elligator_table else self.curve.elligator
 
         if formula_name == 'tvelu':
             self.prime_info = read_prime_info_for_tvelu_test(prime_name)
@@ -124,10 +141,25 @@ class CSIDH:
             raise ValueError(f"the public key: {pk} is not supersingular!")
         return self.group_action(pk, sk)
 
+    def derive_many(self, sk: list, pks: list) -> list:
+        """derive() with many public keys. The codomains are normalized together, with a single inversion."""
+        for pk in pks:
+            if not self.is_supersingular(pk):
+                raise ValueError(f"the public key: {pk} is not supersingular!")
+        As = [self.group_action_projective(pk, sk) for pk in pks]
+        return [anew.get_int_value() for anew in self.curve.normalize_many(As)]
+
+    def group_action(self, a: int, e: list) -> int:
+        A = self.group_action_projective(a, e)
+        anew = A[0] * A[1] ** (-1)  # anew = Ax * Az^(-1)
+        anew = anew.get_int_value()
+        return anew
+
     # FIXME: Wrong result
     # FIXME: Do 38 isogenies, while there are only 36 in fact.
     # it do L[5]=17 and L[14]=53 each once more in an example
-    def group_action(self, a: int, e: list) -> int:
+    def group_action_projective(self, a: int, e: list) -> tuple:
+        """group_action() without the final inversion: return the codomain coefficient as (Ax : Az)."""
         def PointAccept(P, i: int, j: int) -> bool:
             if self.curve.isinfinity(P):
                 return False
@@ -143,14 +175,11 @@ class CSIDH:
 
         def clear_public_prime(T, A24, I: list):
             T = self.curve.xdbl(T, A24); T = self.curve.xdbl(T, A24)
-            for i in range(0, batch_num):
-                if i in I:
-                    continue
-                for j in range(batch_start[i], batch_stop[i]):
-                    T = self.curve.xmul_public(
-                        T, A24, j
-                    )  # public scalar mult： T = L[j] * T
-            return T
+            indices = [
+                j for i in range(0, batch_num) if i not in I for j in range(batch_start[i], batch_stop[i])
+            ]
+            # public scalar mult: T = (prod of these L[j]) * T
+            return self.curve.xmul_public_product(T, A24, indices)
 
         def clear_private_prime(T, A24, I: list, J: list):
             for i in range(len(I)):
@@ -205,9 +234,9 @@ class CSIDH:
                     # eg. use masking technique to avoid break
 
             # "CTIDH inner loop"
-            T0, T1 = self.curve.elligator(A)
+            T0, T1 = self.elligator(A)
             for i in range(0, k):
-                T0, T1 = CSWAP(T0, T1, epsilon[i] < 0)
+                T0, T1 = cswap(T0, T1, epsilon[i] < 0)
                 if i == 0:
                     # T0 = [r]T0
                     T0 = clear_public_prime(T0, A24, I)
@@ -220,7 +249,7 @@ class CSIDH:
                 fi = PointAccept(P, I[i], J[i])
                 maskisogeny = (fi == 1) and (epsilon[i] != 0)
                 if i == k - 2 and k > 2:  # 正在做倒数第二个batch
-                    T0 = CMOV(T0, T1, (epsilon[i + 1] < 0) ^ (epsilon[i] < 0))
+                    T0 = cmov(T0, T1, (epsilon[i + 1] < 0) ^ (epsilon[i] < 0))
 
                 # 做小同源
                 if fi == 1:
@@ -238,25 +267,24 @@ class CSIDH:
                     Anew, Tnew = self.isogeny.matryoshka_isogeny(
                         A, Tnew, Tnewlen, P, J[i]
                     )
-                    A = CMOV(A, Anew, maskisogeny)
+                    A = cmov(A, Anew, maskisogeny)
                     A24 = self.curve.xA24(A)
-                    T0 = CMOV(T0, Tnew[0], maskisogeny)
-                    T1 = CMOV(T1, Tnew[1], maskisogeny)
+                    T0 = cmov(T0, Tnew[0], maskisogeny)
+                    T1 = cmov(T1, Tnew[1], maskisogeny)
 
                 # 处理T0和T1：做完小同源之后清掉对应小素数，避免未来重复做
                 if i == 0:
                     # 第一个小同源做完要出一个新的点，保证T0和T1相互独立
-                    T_plus, T1 = self.curve.elligator(A)
-                    T_plus, T1 = CSWAP(T_plus, T1, epsilon[i] < 0)
+                    T_plus, T1 = self.elligator(A)
+                    T_plus, T1 = cswap(T_plus, T1, epsilon[i] < 0)
                     T1 = clear_public_prime(T1, A24, I)
                     T1 = clear_private_prime(T1, A24, I, J)
                 if i == k - 2 and k > 2:
                     T0 = self.curve.xmul_private(T0, A24, J[i])
                     T1 = deepcopy(T0)
                 elif i < k - 1:
-                    T0, T1 = CSWAP(T0, T1, epsilon[i] < 0) # T0, T1换回去
-                    T0 = self.curve.xmul_private(T0, A24, J[i])
-                    T1 = self.curve.xmul_private(T1, A24, J[i])
+                    T0, T1 = cswap(T0, T1, epsilon[i] < 0) # T0, T1换回去
+                    T0, T1 = self.curve.xmul_private_many([T0, T1], A24, J[i])
 
                 # NOTE: 实际中为了安全会用j扫一遍I[i]这个batch，右值改为 maskisogeny & (J[i] == j)
                 todo[J[i]] -= fi
@@ -266,10 +294,14 @@ class CSIDH:
                 assert batchtodo[I[i]] >= 0
                 assert batchtodosum >= 0
 
-        anew = A[0] * A[1] ** (-1)  # anew = Ax * Az^(-1)
-        anew = anew.get_int_value()
-        return anew
+        return A
 
     def is_supersingular(self, pk: int) -> bool:
-        A = (self.field(pk), self.field(1))
-        return self.curve.issupersingular(A)
+        def validate():
+            A = (self.field(pk), self.field(1))
+            return self.curve.issupersingular(A)
+
+        if self.verdict_cache is None:
+            return validate()
+        # The verdicts of different validation modes are kept apart, even in a shared verdict_store
+        return self.verdict_cache(f"{self.prime_name}:{self.validation}:{int(pk):x}", validate)
@@ -2,7 +2,8 @@ from typing import List
 from math import floor, sqrt
 
 from CTIDH.mont import MontgomeryCurve
-from CTIDH.utils import read_velusqrt_steps_info, hamming_weight, bitlength, isequal, batchmaxprime_of_Li, batchminprime_of_Li, batchnumber_of_Li, CMOV, CSWAP
+from CTIDH.primefield import FpVector
+from CTIDH.utils import read_velusqrt_steps_info, read_velu_formulae_info, velu_formulae_path, hamming_weight, bitlength, isequal, batchmaxprime_of_Li, batchminprime_of_Li, batchnumber_of_Li
 from CTIDH.polymul import PolyMul
 from CTIDH.polyredc import PolyRedc
 
@@ -20,15 +21,67 @@ def doc(s):
             return self.desc
     return __doc
 
+
+# The velusqrt state set by set_parameters_velu() and kps_s(), read by xisog_s() and xeval_s()
+VELUSQRT_STATE = ('sJ', 'sI', 'sK', 'sK_fake', 'J', 'I', 'K', 'XK', 'ZK', 'K_padding',
+                  'ptree_hI', 'hI_reciprocal', 'XZJ4', 'ADD_SQUARED', 'SUB_SQUARED')
+
+
+class KPS:
+    """The kernel precomputation of one l-isogeny phi: E_A -> E_A/<P>, returned by Formulae.kps().
+
+    It holds everything that only depends on the kernel: the hats (Xi+Zi, Xi-Zi) for the traditional Velu formulae,
+    or the points of I, J, K and the product tree of h_I for velusqrt. The codomain is computed once, on first use,
+    and eval_many() pushes any number of points in one pass, so that extra points only cost their own evaluation.
+    """
+
+    def __init__(self, formulae, A: tuple, i: int, velusqrt: bool, **state):
+        self.formulae = formulae
+        self.A = A
+        self.i = i
+        self.velusqrt = velusqrt
+        self.__dict__.update(state)
+        self._codomain = None
+
+    @property
+    def codomain(self) -> tuple:
+        """A' = (Ax': Az'), the codomain of phi."""
+        if self._codomain is None:
+            if self.velusqrt:
+                self._codomain = self.formulae.xisog_s(self.A, self.i, self)
+            else:
+                self._codomain = self.formulae.xisog_t(self.d, self.d_fake, self.hats, self.A)
+        return self._codomain
+
+    def eval(self, T: tuple) -> tuple:
+        """phi(T) for the projective x-coordinate T."""
+        return self.eval_many([T])[0]
+
+    def eval_many(self, Ts: List[tuple]) -> List[tuple]:
+        """[phi(T) for T in Ts], all the points at once."""
+        if self.velusqrt:
+            return self.formulae.xeval_many_s(Ts, self.A, self)
+        return self.formulae.xeval_many_t(self.d, self.d_fake, self.hats, Ts)
+
+    def codomain_and_eval_many(self, Ts: List[tuple]) -> tuple:
+        """(codomain, eval_many(Ts)). The traditional Velu formulae compute both in a single pass, see xisog_eval_t(),
+        unless the codomain is already known.
+        """
+        if self.velusqrt or self._codomain is not None:
+            return self.codomain, self.eval_many(Ts)
+        self._codomain, images = self.formulae.xisog_eval_t(self.d, self.d_fake, self.hats, self.A, Ts)
+        return self._codomain, images
+
+
 # Velu and Velusqrt formula that compute small odd prime degree isogeny.
 def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
     cutoff = 83
-    cutoff_string = f' with cutoff ell <= {cutoff}' if formula_name == 'hvelu' else ''
+    cutoff_string = f' with the measured formulae of data/formulae/, or else cutoff ell <= {cutoff}' if formula_name == 'hvelu' else ''
     NAME = 'Isogeny class using the %s Velu\'s formulae%s' % ({'tvelu':'traditional', 'svelu':'square-root', 'hvelu':'hybrid'}[formula_name], cutoff_string)
 
     @doc(NAME)
     class Formulae:
-        def __init__(self, curve, tuned=True, scaled=False):
+        def __init__(self, curve, tuned=True, scaled=False, measured=True):
             """_summary_
 
             Args:
@@ -36,6 +89,8 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
                 tuned (bool, optional): True if fine-tuned velusqrt information is presented in data folder. Defaults to True.
                 scaled (bool, optional): Use scaled remainder tree or not. 
                 If True, it will read and use velusqrt tuned info for scaled version. Defaults to False.
+                measured (bool, optional): hvelu only. Choose the formula of each batch from the table written by
+                benchmarks/tune_velu.py for the field backend, when there is one, instead of the fixed cutoff. Defaults to True.
             """
             self.formula_name = formula_name
 
@@ -56,6 +111,7 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
 
             # Here, ptree_I corresponds with the product tree determined by I, and I is a set of cardinality sJ
             self.ptree_hI = None
+            self.hI_reciprocal = None
             self.sI = (None,)
 
             # Here, K is a set of cardinality sK
@@ -73,9 +129,47 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
             self.prime_name = curve.prime_name
             self.curve = curve
             self.field = self.curve.field
+            self.vector = FpVector(self.field)
             self.L = self.curve.L
             self.batch_start = self.curve.batch_start
             self.batch_stop = self.curve.batch_stop
+            if formula_name != 'tvelu':
+                # The velusqrt sizes (sJ, sI) of each batch, shared by all its primes, see matryoshka_isogeny()
+                self.batch_sizes_velu = [self.batch_parameters_velu(start, stop) for start, stop in zip(self.batch_start, self.batch_stop)]
+
+            # The formula of each batch, 'tvelu' or 'svelu', that of its largest prime: every prime of the batch costs as
+            # much as it, see kps(). The measured table, if any, overrides the cutoff; HYBRID_BOUND is then the largest
+            # prime of the batches using the traditional formulae.
+            self.velu_formulae = None
+            if formula_name == 'hvelu' and measured:
+                self.velu_formulae = read_velu_formulae_info(curve.prime_name, scaled, self.field.backend)
+            batch_max = [batchmaxprime_of_Li(start, self.batch_start, self.batch_stop, self.L) for start in self.batch_start]
+            if self.velu_formulae is None:
+                self.batch_formulae = ['tvelu' if l <= self.HYBRID_BOUND else 'svelu' for l in batch_max]
+            else:
+                self.batch_formulae = [self.velu_formulae[l] for l in batch_max]
+                self.HYBRID_BOUND = max((l for l, f in zip(batch_max, self.batch_formulae) if f == 'tvelu'), default=1)
+
+            # What this instance actually does, NAME being that of the class
+            self.NAME = NAME
+            if formula_name == 'hvelu':
+                traditional = self.batch_formulae.count('tvelu')
+                source = f'measured in {velu_formulae_path(curve.prime_name, scaled, self.field.backend)}' \
+                    if self.velu_formulae is not None else 'with cutoff'
+                self.NAME = 'Isogeny class using the hybrid Velu\'s formulae %s: traditional for %d of the %d batches, ' \
+                    'up to ell <= %d' % (source, traditional, len(batch_max), self.HYBRID_BOUND)
+
+            # Per-function attribution of the Fp-operations, see ZModPrime.counting(). Nothing is wrapped without counting.
+            if self.field.counted:
+                self.kps_t = self.field.attributed(self.kps_t)
+                self.xisog_t = self.field.attributed(self.xisog_t)
+                self.xeval_t = self.field.attributed(self.xeval_t)
+                self.kps_s = self.field.attributed(self.kps_s)
+                self.xisog_s = self.field.attributed(self.xisog_s)
+                self.xeval_s = self.field.attributed(self.xeval_s)
+                self.xeval_many_t = self.field.attributed(self.xeval_many_t)
+                self.xisog_eval_t = self.field.attributed(self.xisog_eval_t)
+                self.xeval_many_s = self.field.attributed(self.xeval_many_s)
 
             self.poly_mul = PolyMul(self.field)
             self.poly_redc = PolyRedc(self.poly_mul)
@@ -99,6 +193,9 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
             #     self.velusqrt_cost()
                 
 
+        def __repr__(self):
+            return self.NAME
+
         def ceval(self, l: int):
             return numpy.array([2.0 * (l - 1.0), 2.0, (l + 1.0)])
 
@@ -137,47 +234,40 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
             assert 0 <= Tnewlen <= 2
             assert i < len(self.L)
             
+            kps = self.kps(P, A, i)
+            A_new, Ts[:Tnewlen] = kps.codomain_and_eval_many(Ts[:Tnewlen])
+            return A_new, Ts
+
+        def kps(self, P: tuple, A: tuple, i: int) -> KPS:
+            """The kernel precomputation of the L[i]-isogeny E_A -> E_A/<P>, padded to the largest prime of the batch.
+            Its codomain and eval_many() cost the same for all the primes of a batch.
+
+            Args:
+                P (tuple): projective x-coordinate of the kernel point P, of order L[i]
+                A (tuple): A = (Ax: Az), the domain
+                i (int): the index of the prime
+            """
             l = self.L[i]
             l_fake = batchmaxprime_of_Li(i, self.batch_start, self.batch_stop, self.L)
+            batch = batchnumber_of_Li(i, self.batch_start, self.batch_stop)
             A24 = self.curve.xA24(A)
-            # NOTE: Here we use l_fake to decide which formula to use(traditional velu or velusqrt) to avoid timing attack.
+            # NOTE: The formula (traditional velu or velusqrt) is that of the batch, to avoid timing attack.
             # It may be unsafe if different primes in the same batch use different formulae.
-            if l_fake <= self.HYBRID_BOUND:     # Use Velu formula
+            if self.batch_formulae[batch] == 'tvelu':     # Use Velu formula
                 d = (l-1)//2
                 d_fake = (l_fake-1)//2
+                Xi_Zi_hats = self.hats(self.kps_t(d_fake, P, A24))
+                return KPS(self, A, i, False, d=d, d_fake=d_fake, hats=Xi_Zi_hats)
 
-                xiP_list = self.kps_t(d_fake, P, A24)
-                Xi_Zi_hats = [(Xi+Zi, Xi-Zi) for (Xi, Zi) in xiP_list]
-                # for xiP in xiP_list:
-                #     Xi, Zi = xiP
-                #     Xi_Zi_hat = (Xi + Zi, Xi - Zi)
-                #     Xi_Zi_hats.append(Xi_Zi_hat)
-
-                A_new = self.xisog_t(d, d_fake, Xi_Zi_hats, A)
-
-                if Tnewlen > 0:
-                    Ts[0] = self.xeval_t(d, d_fake, Xi_Zi_hats, Ts[0])
-                if Tnewlen > 1:
-                    Ts[1] = self.xeval_t(d, d_fake, Xi_Zi_hats, Ts[1])
-
-                return A_new, Ts
-            
-            else:    # Use Velusqrt formulas
-                if self.tuned:
-                    self.set_parameters_velu(self.sJ_list[i], self.sI_list[i], i)
-                else:
-                    if self.L[i] == 3:
-                        b = 0
-                        c = 0
-                    else:
-                        b = int(floor(sqrt(self.L[i] - 1) / 2.0))
-                        c = int(floor((self.L[i] - 1.0) / (4.0 * b)))
-                    self.set_parameters_velu(b, c, i)
-                # Now sI, sJ, sK are set.
+            # Use Velusqrt formulas
+            # The sizes sI, sJ are those of the batch, and K is padded to the size of l_fake.
+            b, c = self.batch_sizes_velu[batch]
+            self.set_parameters_velu(b, c, i, l_fake)
+            # Now sI, sJ, sK, sK_fake are set.
+            self.kps_s(P, A24, i)
+            return KPS(self, A, i, True, **{name: getattr(self, name) for name in VELUSQRT_STATE})
 
-                raise NotImplementedError("matryoshka isogeny of velusqrt not implemented yet!")
 
-        
         def kps_t(self, d_fake: int, P: tuple, A24: tuple) -> List[tuple]:
             """Timing attack safe kps for traditional velu formula, 
             used in computing the l-isogeny phi: E -> E/<P>.
@@ -207,7 +297,7 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
                 d (int): d = (l-1)/2.
                 d_fake (int): (l_fake - 1)/2
                 Xi_Zi_hats (List[tuple]): list of (Xi+Zi : Xi-Zi) where (Xi : Zi) is x([i]P), P a generator of ker phi. 
-                i ranges from 1 to d_fake.
+                i ranges from 1 to d_fake. May also be given as the pair of FpVectors returned by hats().
                 A (tuple): A = (Ax: Az). Ax and Az must have type ZModPrime(Primefield).
                 Ax/Az is the quadratic term's coefficient of domain curve's affine equation. 
 
@@ -221,21 +311,13 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
 
             t = Az + Az
             aE = Ax + t; dE = Ax - t
-            al = aE.safe_pow(l, l_maxbitlen); dl = dE.safe_pow(l, l_maxbitlen)
-            pi_Y = self.field(1); pi_Z = self.field(1)
-
-            # print(f'd = {d}, d_fake = {d_fake}')
-            for i in range(d_fake):
-                tmp1 = pi_Y * Xi_Zi_hats[i][1]
-                tmp2 = pi_Z * Xi_Zi_hats[i][0]
-                pi_Y = CMOV(pi_Y, tmp1, i <= d-1)
-                pi_Z = CMOV(pi_Z, tmp2, i <= d-1)
-
-            # for i in range(d):
-            #     pi_Y *= Xi_Zi_hats[i][1]
-            #     pi_Z *= Xi_Zi_hats[i][0]
-            # print(f'Correct pi_Y = {pi_Y}, pi_Z = {pi_Z}')
-            
+            al, dl = self.field.safe_pow2(aE, dE, l, l_maxbitlen)
+            # Only the first d factors count, the padding ones are replaced by 1
+            X_hats, Z_hats = self.hats_vectors(Xi_Zi_hats)
+            pad = numpy.arange(d_fake) >= d
+            pi_Y = Z_hats.cmov(1, pad).prod()
+            pi_Z = X_hats.cmov(1, pad).prod()
+
             aE_new = al * pi_Z ** 8; dE_new = dl * pi_Y ** 8
             aE_dE = aE_new + dE_new; Ax_new = aE_dE + aE_dE; Az_new = aE_new - dE_new
 
@@ -248,7 +330,8 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
             Args:
                 d (int): degree of isogeny
                 d_fake (int): the largest prime in the same batch as l.
-                Xi_Zi_hats (List[tuple]): (Xi+Zi : Xi-Zi) where (Xi:Zi) x[i]P, i = 1, ..., d_fake
+                Xi_Zi_hats (List[tuple]): (Xi+Zi : Xi-Zi) where (Xi:Zi) x[i]P, i = 1, ..., d_fake.
+                May also be given as the pair of FpVectors returned by hats().
                 T (tuple): (projective x-coordinate of) the point to push 
 
             Returns:
@@ -256,21 +339,101 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
             """
             X, Z = T
             X_hat, Z_hat = X+Z, X-Z
-            X1_hat, Z1_hat = Xi_Zi_hats[0]
-            X_prime, Z_prime = self.curve.crisscross(X1_hat, Z1_hat, X_hat, Z_hat)
-            for i in range(1, d_fake):
-                Xi_hat, Zi_hat = Xi_Zi_hats[i]
-                t0, t1 = self.curve.crisscross(Xi_hat, Zi_hat, X_hat, Z_hat)
-                tmp1, tmp2 = t0*X_prime, t1*Z_prime
-                X_prime = CMOV(X_prime, tmp1, i<=d-1)
-                Z_prime = CMOV(Z_prime, tmp2, i<=d-1)
+            X_hats, Z_hats = self.hats_vectors(Xi_Zi_hats)
+            # crisscross(Xi_hat, Zi_hat, X_hat, Z_hat) for all i at once
+            t1 = X_hats * Z_hat
+            t2 = Z_hats * X_hat
+            t0 = t1 + t2
+            t1 -= t2
+            pad = numpy.arange(d_fake) >= d
+            X_prime = t0.cmov(1, pad).prod()
+            Z_prime = t1.cmov(1, pad).prod()
             X_prime, Z_prime = X*X_prime**2, Z*Z_prime**2
             return X_prime, Z_prime
 
+        def xeval_many_t(self, d: int, d_fake: int, Xi_Zi_hats: List[tuple], Ts: List[tuple]) -> List[tuple]:
+            """[xeval_t(d, d_fake, Xi_Zi_hats, T) for T in Ts], with the same Fp-operations, but all the points at once:
+            the crisscross of every (T, i) pair is one vector of len(Ts) * d_fake entries, padded with a single CMOV.
+            """
+            m = len(Ts)
+            if m == 0:
+                return []
+            X = self.vector(X for X, _ in Ts)
+            Z = self.vector(Z for _, Z in Ts)
+            X_hat, Z_hat = (X + Z).repeat(d_fake), (X - Z).repeat(d_fake)
+            X_hats, Z_hats = self.hats_vectors(Xi_Zi_hats)
+            # Block k holds the crisscross(Xi_hat, Zi_hat, X_hat, Z_hat) of Ts[k]
+            t1 = X_hats.tile(m) * Z_hat
+            t2 = Z_hats.tile(m) * X_hat
+            t0 = t1 + t2
+            t1 -= t2
+            pad = numpy.tile(numpy.arange(d_fake) >= d, m)
+            X_primes = X * t0.cmov(1, pad).prod_blocks(m) ** 2
+            Z_primes = Z * t1.cmov(1, pad).prod_blocks(m) ** 2
+            return list(zip(X_primes, Z_primes))
+
+        def xisog_eval_t(self, d: int, d_fake: int, Xi_Zi_hats: List[tuple], A: tuple, Ts: List[tuple]) -> tuple:
+            """(xisog_t(d, d_fake, Xi_Zi_hats, A), xeval_many_t(d, d_fake, Xi_Zi_hats, Ts)) with the same Fp-operations,
+            in a single pass over the kernel multiples: pi_Y, pi_Z and the two products of every point of Ts are the
+            blocks of one vector, padded with one CMOV and multiplied out together, one vector product per tree level.
+            """
+            assert d_fake >= d
+            m = len(Ts)
+            Ax, Az = A
+            l = 2*d + 1; l_maxbitlen = (2*d_fake + 1).bit_length()
+
+            t = Az + Az
+            aE = Ax + t; dE = Ax - t
+            al, dl = self.field.safe_pow2(aE, dE, l, l_maxbitlen)
+
+            X_hats, Z_hats = self.hats_vectors(Xi_Zi_hats)
+            blocks = [Z_hats, X_hats]
+            if m > 0:
+                X = self.vector(X for X, _ in Ts)
+                Z = self.vector(Z for _, Z in Ts)
+                X_hat, Z_hat = (X + Z).repeat(d_fake), (X - Z).repeat(d_fake)
+                t1 = X_hats.tile(m) * Z_hat
+                t2 = Z_hats.tile(m) * X_hat
+                t0 = t1 + t2
+                t1 -= t2
+                blocks += [t0, t1]
+            pad = numpy.tile(numpy.arange(d_fake) >= d, 2 + 2*m)
+            products = self.vector.concatenate(blocks).cmov(1, pad).prod_blocks(2 + 2*m)
+
+            pi_Y, pi_Z = products[0], products[1]
+            aE_new = al * pi_Z ** 8; dE_new = dl * pi_Y ** 8
+            aE_dE = aE_new + dE_new; Ax_new = aE_dE + aE_dE; Az_new = aE_new - dE_new
+            if m == 0:
+                return (Ax_new, Az_new), []
+            X_primes = X * products[2:2 + m] ** 2
+            Z_primes = Z * products[2 + m:] ** 2
+            return (Ax_new, Az_new), list(zip(X_primes, Z_primes))
+
+
+        def hats(self, Xi_Zis: List[tuple]) -> tuple:
+            """Return the vectors of Xi+Zi and Xi-Zi, i.e. the Xi_Zi_hats used by xisog_t and xeval_t, in two vector additions.
+
+            Args:
+                Xi_Zis (List[tuple]): the list of x([i]P) returned by kps_t
+            """
+            Xs = self.vector(Xi for Xi, _ in Xi_Zis)
+            Zs = self.vector(Zi for _, Zi in Xi_Zis)
+            return (Xs + Zs, Xs - Zs)
+
+
+        def hats_vectors(self, Xi_Zi_hats) -> tuple:
+            """Xi_Zi_hats as the pair of vectors (Xi+Zi)_i, (Xi-Zi)_i.
+            Xi_Zi_hats is either such a pair (see hats()) or the list of tuples (Xi+Zi, Xi-Zi).
+            """
+            if isinstance(Xi_Zi_hats, tuple):
+                return Xi_Zi_hats
+            return (self.vector(X_hat for X_hat, _ in Xi_Zi_hats), self.vector(Z_hat for _, Z_hat in Xi_Zi_hats))
+
 
         # NOTE: This functions is used for setting the cardinalities sI, sJ, and sK
         # In sibc it is called by velusqrt_cost()
-        def set_parameters_velu(self, b, c, i):
+        def set_parameters_velu(self, b, c, i, l_fake=None):
+            """sJ = b, sI = c and sK for L[i]. kps_s() pads K to sK_fake, the size of K for l_fake (default L[i])."""
             assert b <= c
             # At this step, everythin is correct
             self.sJ = b
@@ -278,17 +441,213 @@ def MontgomeryIsogeny(formula_name='tvelu', uninitialized = False):
             d = ((self.L[i] - 2 - 4 * b * c - 1) // 2) + 1
             assert d >= 0
             self.sK = d
+            self.sK_fake = d if l_fake is None else (l_fake - 1 - 4 * b * c) // 2
+            assert self.sK_fake >= d
             return None
 
-        # TODO: Implement these velusqrt algorithms
-        def kps_s(self, P: tuple, A: tuple, i: int):
-            raise NotImplementedError
-        
-        def xisog_s(self, A, i):
-            raise NotImplementedError
-        
-        def xeval_s(self, P, A):
-            raise NotImplementedError
-        
+        def parameters_velu(self, l: int) -> tuple:
+            """Untuned (sJ, sI) for l: sJ about sqrt(l)/2 and sI as large as 4 sJ sI < l allows."""
+            if l == 3:
+                return 0, 0
+            b = int(floor(sqrt(l - 1) / 2.0))
+            c = int(floor((l - 1.0) / (4.0 * b)))
+            return b, c
+
+        def batch_parameters_velu(self, start: int, stop: int) -> tuple:
+            """(sJ, sI) for all the primes of the batch L[start:stop]. I +- J must fit in the smallest prime: among the
+            tuned sizes of the batch that do, the largest I +- J is taken, i.e. the least padding of K.
+            """
+            l_min = self.L[start]
+            if not self.tuned:
+                return self.parameters_velu(l_min)
+            candidates = [(self.sJ_list[j], self.sI_list[j]) for j in range(start, stop)]
+            return max((bc for bc in candidates if 4 * bc[0] * bc[1] <= l_min - 1), key=lambda bc: bc[0] * bc[1])
+
+        # Velusqrt (https://eprint.iacr.org/2020/341): the odd multiples 1, 3, ..., l-2 of the kernel point are split as
+        # (I + J) u (I - J) u K, with I = {2b(2i+1) : 0 <= i < c}, J = {2j+1 : 0 <= j < b} and K = {4bc+1, ..., l-2}
+        # (b = sJ, c = sI). Then h_S(X) = prod_{s in S} (X - x([s]P)) is h_K(X) times the resultant of h_I(Z) and
+        # E_{J,X}(Z) = prod_{j in J} (F0(Z, x_j) X^2 + F1(Z, x_j) X + F2(Z, x_j)), up to a factor independent of X,
+        # where (X - x(Q+R))(X - x(Q-R)) = X^2 + F1(x_Q, x_R)/F0(x_Q, x_R) X + F2(x_Q, x_R)/F0(x_Q, x_R).
+        # The resultant is the product of the E_{J,X}(x_i), i in I, obtained from a remainder tree over h_I.
+        # xisog_s() needs h_S(1) / h_S(-1) and xeval_s() needs h_S(1/x) / h_S(x), so that factor never matters.
+
+        def kps_s(self, P: tuple, A24: tuple, i: int):
+            """Velusqrt kps: the points of I, J and K, the product tree of h_I and what E_{J,1}, E_{J,-1} need.
+            sI, sJ, sK and sK_fake must have been set by set_parameters_velu() for the index i.
+
+            Args:
+                P (tuple): projective x-coordinate of the kernel point P, of order L[i]
+                A24 (tuple): A24 = (Ax+2Az : 4Az)
+                i (int): the index of the prime
+            """
+            assert self.sK == (self.L[i] - 1 - 4 * self.sJ * self.sI) // 2
+            xdbl, xadd, xmul_int = self.curve.xdbl, self.curve.xadd, self.curve.xmul_int
+            b, c = self.sJ, self.sI
+            P2 = xdbl(P, A24)
+
+            # J: [1]P, [3]P, ..., [2b-1]P
+            self.J = [P] if b > 0 else []
+            if b > 1:
+                self.J.append(xadd(P2, P, P))
+            for j in range(2, b):
+                self.J.append(xadd(self.J[j - 1], P2, self.J[j - 2]))
+
+            # I: [2b]P, [6b]P, ..., [2b(2c-1)]P
+            self.I = []
+            if c > 0:
+                P2b = xmul_int(P, A24, 2 * b)
+                P4b = xdbl(P2b, A24)
+                self.I = [P2b]
+                if c > 1:
+                    self.I.append(xadd(P2b, P4b, P2b))
+                for j in range(2, c):
+                    self.I.append(xadd(self.I[j - 1], P4b, self.I[j - 2]))
+
+            # K: [4bc+1]P, [4bc+3]P, ..., [l-2]P, then up to [l_fake-2]P (only the first sK factors are used)
+            sK = self.sK_fake
+            if b == 0:
+                self.K = [P] if sK > 0 else []
+                if sK > 1:
+                    self.K.append(xadd(P2, P, P))
+            else:
+                self.K = [xmul_int(P, A24, 4 * b * c + 1 + 2 * k) for k in range(min(sK, 2))]
+            for k in range(2, sK):
+                self.K.append(xadd(self.K[k - 1], P2, self.K[k - 2]))
+            self.XK = self.vector(Xk for Xk, _ in self.K)
+            self.ZK = self.vector(Zk for _, Zk in self.K)
+            self.K_padding = numpy.arange(sK) >= self.sK
+
+            # Product tree of h_I(Z) = prod_{i in I} (Zi Z - Xi), ready for the remainder trees of E_J of degree 2b
+            if c > 0:
+                ptree_hI = self.poly_mul.product_tree([[-Xi, Zi] for Xi, Zi in self.I], c)
+                if self.SCALED_MULTIEVALUATION:
+                    # a / rev(h_I) mod Z^(2b+1), for the series E_J / h_I at the root of the scaled remainder tree
+                    self.hI_reciprocal, _ = self.poly_redc.reciprocal(ptree_hI['poly'][::-1], c + 1, 2 * b + 1)
+                    self.ptree_hI = ptree_hI
+                else:
+                    self.ptree_hI = self.poly_redc.reciprocal_tree(
+                        {'rpoly': [1], 'rdeg': 0, 'fpoly': [1], 'fdeg': 0, 'a': 1}, 2 * b + 1, ptree_hI, c
+                    )
+
+            # E_{J,1} and E_{J,-1} only depend on the x_j through these
+            self.XZJ4 = []
+            self.ADD_SQUARED = []
+            self.SUB_SQUARED = []
+            for Xj, Zj in self.J:
+                XZj = Xj * Zj
+                self.XZJ4.append(XZj * 4)
+                self.ADD_SQUARED.append((Xj + Zj) ** 2)
+                self.SUB_SQUARED.append((Xj - Zj) ** 2)
+
+        def resultant_hI(self, EJ: list, kps=None):
+            """prod_{i in I} E_J(x_i) for E_J of degree 2 sJ, up to a factor that only depends on h_I, via a remainder tree.
+            The product tree of h_I is that of kps (a KPS), by default the one last computed by kps_s().
+            """
+            kps = self if kps is None else kps
+            b, c = kps.sJ, kps.sI
+            if c == 0:
+                return self.field(1)
+            if self.SCALED_MULTIEVALUATION:
+                # Top of the scaled remainder tree: the coefficients of Z^-1, ..., Z^-c of E_J / h_I, Z^-1 last
+                m = 2 * b
+                series = self.poly_mul.poly_mul_modxn(m + 1, EJ[::-1], m + 1, kps.hI_reciprocal, m + 1)
+                top = [series[m - t] if m >= t else 0 for t in range(c)]
+                leaves = self.poly_redc.multieval_scaled(top, c, [1] + [0] * (c - 1), c, kps.ptree_hI, c)
+            else:
+                leaves = self.poly_redc.multieval_unscaled(EJ, 2 * b + 1, kps.ptree_hI, c)
+            return self.poly_mul.product(leaves, c)
+
+        def xisog_s(self, A: tuple, i: int, kps=None) -> tuple:
+            """Velusqrt xisog: the codomain A' = (Ax': Az') of the l-isogeny whose kernel was given to kps_s(),
+            or of kps (a KPS) when given.
+            As in xisog_t(), aE' = aE^l h_S(-1)^8 and dE' = dE^l h_S(1)^8 for the twisted Edwards (aE : dE) = (A+2 : A-2).
+            """
+            kps = self if kps is None else kps
+            Ax, Az = A
+            l = self.L[i]
+            t = Az + Az
+            aE = Ax + t; dE = Ax - t
+            # 4 Az (F0 + F1 + F2)(Z, x_j) Zj^2 = 4 Az (Xj - Zj)^2 (Z - 1)^2 - 16 (Ax + 2 Az) Xj Zj Z and, for X = -1,
+            # 4 Az (F0 - F1 + F2)(Z, x_j) Zj^2 = 4 Az (Xj + Zj)^2 (Z + 1)^2 + 16 (Ax - 2 Az) Xj Zj Z
+            Az4 = t + t
+            aE4 = aE * 4; dE4 = dE * 4
+            EJ_1, EJ_minus1 = [], []
+            for XZj4, ADDj, SUBj in zip(kps.XZJ4, kps.ADD_SQUARED, kps.SUB_SQUARED):
+                t0 = SUBj * Az4
+                t1 = t0 + t0 + XZj4 * aE4
+                EJ_1.append([t0, -t1, t0])
+                t0 = ADDj * Az4
+                t1 = t0 + t0 + XZj4 * dE4
+                EJ_minus1.append([t0, t1, t0])
+            # Both are self-reciprocal
+            EJ_1 = self.poly_mul.product_selfreciprocal_tree(EJ_1, kps.sJ)['poly']
+            EJ_minus1 = self.poly_mul.product_selfreciprocal_tree(EJ_minus1, kps.sJ)['poly']
+
+            # h_K(1) and h_K(-1), up to the same sign
+            hK_1 = (kps.ZK - kps.XK).cmov(1, kps.K_padding).prod()
+            hK_minus1 = (kps.ZK + kps.XK).cmov(1, kps.K_padding).prod()
+
+            h_1 = hK_1 * self.resultant_hI(EJ_1, kps)
+            h_minus1 = hK_minus1 * self.resultant_hI(EJ_minus1, kps)
+
+            l_fake = 4 * kps.sJ * kps.sI + 2 * kps.sK_fake + 1
+            al, dl = self.field.safe_pow2(aE, dE, l, l_fake.bit_length())
+            aE_new = al * h_minus1 ** 8; dE_new = dl * h_1 ** 8
+            aE_dE = aE_new + dE_new; Ax_new = aE_dE + aE_dE; Az_new = aE_new - dE_new
+            return (Ax_new, Az_new)
+
+        def xeval_s(self, P: tuple, A: tuple, kps=None) -> tuple:
+            """Velusqrt xeval: the image of P = (X : Z) under the l-isogeny whose kernel was given to kps_s(),
+            or of kps (a KPS) when given.
+            As in xeval_t(), (X : Z) -> (X h_S(1/x)^2 : Z h_S(x)^2) with x = X/Z, up to the same factor.
+            """
+            return self.xeval_many_s([P], A, kps)[0]
+
+        def xeval_many_s(self, Ps: List[tuple], A: tuple, kps=None) -> List[tuple]:
+            """[xeval_s(P, A, kps) for P in Ps], with the same Fp-operations. The coefficients of the E_{J,x} and the
+            h_K(x), h_K(1/x) of all the points are computed at once, only the remainder trees are run point by point.
+            """
+            kps = self if kps is None else kps
+            m = len(Ps)
+            if m == 0:
+                return []
+            Ax, Az = A
+            X = self.vector(X for X, _ in Ps)
+            Z = self.vector(Z for _, Z in Ps)
+            XZ = X * Z
+            AxXZ = XZ * Ax
+            # Z^2 Zj^2 Az (F0 x^2 + F1 x + F2)(Z', x_j) has coefficients
+            # Az (Xj X - Zj Z)^2, -2 Az (Xj X + Zj Z)(Xj Z + Zj X) - 4 Ax Xj Zj X Z, Az (Zj X - Xj Z)^2
+            # Block k holds those of Ps[k], for all j in J
+            b = kps.sJ
+            XJ = self.vector(Xj for Xj, _ in kps.J).tile(m)
+            ZJ = self.vector(Zj for _, Zj in kps.J).tile(m)
+            Xb, Zb = X.repeat(b), Z.repeat(b)
+            t0 = XJ * Xb; t1 = ZJ * Zb; t2 = XJ * Zb; t3 = ZJ * Xb
+            c0 = (t0 - t1) ** 2 * Az
+            c2 = (t3 - t2) ** 2 * Az
+            c1 = (t0 + t1) * (t2 + t3)
+            c1 = c1 * Az
+            c1 += c1
+            c1 += self.vector(kps.XZJ4).tile(m) * AxXZ.repeat(b)
+            c1 = -c1
+
+            sK = kps.sK_fake
+            XK, ZK = kps.XK.tile(m), kps.ZK.tile(m)
+            Xk, Zk = X.repeat(sK), Z.repeat(sK)
+            pad = numpy.tile(kps.K_padding, m)
+            hK = (ZK * Xk - XK * Zk).cmov(1, pad).prod_blocks(m)
+            hK_inverse = (ZK * Zk - XK * Xk).cmov(1, pad).prod_blocks(m)
+
+            h, h_inverse = [], []
+            for k in range(m):
+                block = slice(k * b, (k + 1) * b)
+                EJ = self.poly_mul.product_tree([list(c) for c in zip(c0[block], c1[block], c2[block])], b)['poly']
+                # E_{J,1/x} is E_{J,x} reversed
+                h.append(hK[k] * self.resultant_hI(EJ, kps))
+                h_inverse.append(hK_inverse[k] * self.resultant_hI(EJ[::-1], kps))
+            X_primes = X * self.vector(h_inverse) ** 2
+            Z_primes = Z * self.vector(h) ** 2
+            return list(zip(X_primes, Z_primes))
 
     return Formulae
\ No newline at end of file
@@ -1,14 +1,18 @@
+import functools
+import secrets
+
 import numpy
-from sage.all import sqrt
-from copy import deepcopy
-from .primefield import PrimeField
-from .utils import read_prime_info, attrdict, CMOV, CSWAP, memoize, binrep, read_SDAC_info
+from math import isqrt, prod
+from .primefield import PrimeField, FpVector, Fp2
+from .utils import read_prime_info, attrdict, cmov, cswap, memoize, binrep, read_SDAC_info, prac_chain
 
 # MontgomeryCurve class determines the family of supersingular elliptic curves over GF(p)
 
 
 @memoize
-def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original"):
+def MontgomeryCurve(
+    prime_name="p1024_CTIDH", SDAC=False, validation="original", backend="sage", counting=True, PRAC=False
+):
     if validation not in ["original", "doliskani", "pairing1", "pairing2"]:
         raise ValueError
 
@@ -25,7 +29,7 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
     batch_maxdaclen = prime_info["batch_maxdaclen"]
     # batch_bound = prime_info["batch_bound"]
 
-    field = PrimeField(p)
+    field = PrimeField(p, backend, counting)
 
     type_field = type(field(2))
 
@@ -34,6 +38,11 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
     assert len(SDACS) > 0, f'No precomputed sdac information for {prime_name}'
     SDACS_LENGTH = list(map(len, SDACS))
     SDACS_REVERSED = list(map(lambda x:x[::-1], SDACS))
+    # For xmul_SDAC_safe(): each chain as the bits of an int, and the max chain length of the batch of each l
+    SDACS_INT = [sum(b << i for i, b in enumerate(dac)) for dac in SDACS_REVERSED]
+    SDACS_MAXLENGTH = [
+        batch_maxdaclen[i] for i in range(len(batch_start)) for _ in range(batch_start[i], batch_stop[i])
+    ]
 
 
     def cmul(l: int):
@@ -51,12 +60,14 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
         return x[0] + SQR * x[1] + ADD * x[2]
 
 
-    def elligator(A: tuple):
+    def elligator(A: tuple, fast_legendre: bool = True):
         """Elligator from CTIDH original implementation (NOT Elligator 2)
 
         Args:
             A (tuple): tuple of ZModPrime class objects (Ax, Az), represent
               A = Ax / Az , or (Ax: Az) in P^1
+            fast_legendre (bool, optional): decide the square with is_square_fast() (1M + 1S).
+              False keeps the (p-1)/2 exponentiation of is_square(), e.g. for op-count comparisons. Defaults to True.
 
         Returns:
             T+, T- (tuple):  projective x-coordinates of random points on EA(Fp) and EA(Fp^2) respectively.
@@ -75,8 +86,6 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
             raise TypeError("Input must be ZModPrime type tuple!")
 
         while True:
-            one = field(1)
-
             # TODO: Change to a nice random generator
             u = field.get_random()  # line 1 of my pseudocode
             if u == 0:
@@ -85,29 +94,55 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
             D = u2 - 1
             if D == 0:
                 continue  # line 7 of my pseudocode
+            return elligator_core(A, u2, D, fast_legendre)
 
-            M = u2 * Ax
-            T = M * Ax
-            ctrl = Ax == 0
-            P = Ax
-            P = CMOV(P, one, ctrl)  # line 12 of my pseudocode
-            M = CMOV(M, one, ctrl)
-            T = CMOV(T, one, ctrl)
-            D = D * Az
-            D2 = D**2
-            T = T + D2
-            T = T * D
-            T = T * P  # line 19 of my pseudocode
-
-            Tplus_x = P
-            Tminus_x = -M
-            ctrl = not T.is_square()
-            Tplus_x, Tminus_x = CSWAP(Tplus_x, Tminus_x, ctrl)
-
-            Tplus_z = D
-            Tminus_z = D
-
-            return (Tplus_x, Tplus_z), (Tminus_x, Tminus_z)
+    def elligator_core(A: tuple, u2, D, fast_legendre: bool):
+        """Lines 9- of elligator() from u^2 and u^2 - 1, which are only read (they may be shared)."""
+        Ax, Az = A
+        one = field(1)
+        M = u2 * Ax
+        T = M * Ax
+        ctrl = Ax == 0
+        P = Ax
+        P = cmov(P, one, ctrl)  # line 12 of my pseudocode
+        M = cmov(M, one, ctrl)
+        T = cmov(T, one, ctrl)
+        D = D * Az
+        D2 = D**2
+        T = T + D2
+        T = T * D
+        T = T * P  # line 19 of my pseudocode
+
+        Tplus_x = P
+        Tminus_x = -M
+        ctrl = not (T.is_square_fast() if fast_legendre else T.is_square())
+        Tplus_x, Tminus_x = cswap(Tplus_x, Tminus_x, ctrl)
+
+        Tplus_z = D
+        Tminus_z = D
+
+        return (Tplus_x, Tplus_z), (Tminus_x, Tminus_z)
+
+    # Elligator seeds as in the CTIDH software: u = 2, 3, ..., with u^2 and u^2 - 1 precomputed.
+    ELLIGATOR_TABLE_SIZE = 64
+    ELLIGATOR_TABLE = [(field(u * u), field(u * u - 1)) for u in range(2, ELLIGATOR_TABLE_SIZE + 2)]
+
+    def elligator_many(A: tuple, count: int, fast_legendre: bool = True) -> list:
+        """
+        count pairs (T+, T-) as returned by elligator(A), for count distinct u drawn from ELLIGATOR_TABLE.
+        Saves the random u, its square and the checks of elligator(); distinct u keep the pairs independent.
+        """
+        Ax, Az = A
+        if not isinstance(Ax, type_field) or not isinstance(Az, type_field):
+            raise TypeError("Input must be ZModPrime type tuple!")
+        if not 0 < count <= ELLIGATOR_TABLE_SIZE:
+            raise ValueError(f"count must be in [1, {ELLIGATOR_TABLE_SIZE}], got {count}")
+        seeds = secrets.SystemRandom().sample(ELLIGATOR_TABLE, count)
+        return [elligator_core(A, u2, D, fast_legendre) for u2, D in seeds]
+
+    def elligator_table(A: tuple, fast_legendre: bool = True):
+        """elligator(A) with u drawn from ELLIGATOR_TABLE, see elligator_many()."""
+        return elligator_many(A, 1, fast_legendre)[0]
 
     def affine_to_projective(affine) -> tuple:
         """
@@ -118,6 +153,17 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
         """
         return (affine + field(2), field(4))
 
+    def normalize_many(points: list) -> list:
+        """
+        normalize_many()
+        input : a list of projective x-coordinates x(P) := (XP : ZP), or of
+                projective coefficients A = (Ax : Az), all with nonzero Z
+        output: the list of affine values XP/ZP, computed with a single
+                inversion (see ZModPrime.batch_invert)
+        """
+        Z_invs = field.batch_invert([P[1] for P in points])
+        return [P[0] * Z_inv for P, Z_inv in zip(points, Z_invs)]
+
     # def coeff(A24: tuple):
     #     """
     #     ----------------------------------------------------------------------
@@ -165,15 +211,17 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
         # NOTE: in fact XP and ZP can be zero during the protocol
         # assert XP != 0 and ZP != 0 
 
+        # Only fresh temporaries are updated in place, never the inputs.
         V1 = XP + ZP  # line 1 of my pseudo code
         V1 **= 2
         V2 = XP - ZP
         V2 **= 2
-        Z2P = A24[1] * V2
+        Z2P = V2 * A24[1]
         X2P = Z2P * V1  # line 6 of my pseudo code
 
         V1 -= V2
-        Z2P += A24[0] * V1
+        V2 = V1 * A24[0]
+        Z2P += V2
         Z2P *= V1
 
         return (X2P, Z2P)
@@ -192,19 +240,22 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
         XPQ, ZPQ = PQ
         # assert XPQ != 0
 
+        # Only fresh temporaries are updated in place, never the inputs.
         V0 = XP + ZP
         V1 = XQ - ZQ
-        V1 = V1 * V0
+        V1 *= V0
         V0 = XP - ZP
         V2 = XQ + ZQ
-        V2 = V2 * V0
+        V2 *= V0
         V3 = V1 + V2
 
         V3 **= 2
-        V4 = V1 - V2
-        V4 **= 2
-        X_plus = ZPQ * V3
-        Z_plus = XPQ * V4
+        V1 -= V2  # V4 = V1 - V2
+        V1 **= 2
+        V3 *= ZPQ
+        V1 *= XPQ
+        X_plus = V3
+        Z_plus = V1
         # if ZPQ == 0:
         #     assert X_plus == 0 and Z_plus == 0 
             # X_plus = 1; Z_plus = 0
@@ -217,9 +268,8 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
         t_2 = (beta * gamma)
         #return (t_1 + t_2), (t_1 - t_2)
         # shave off a FF allocation: ##
-        t_3 = t_1.copy() # object.__new__(t_1.__class__); t_3.x = t_1.x #      ## copy(t_1)
+        t_3 = t_1 - t_2               ## t_1.copy(); t_3 -= t_2
         t_1 += t_2                    ##
-        t_3 -= t_2                   ##
         return t_1, t_3 # (t_1 + t_2), (t_1 - t_2)
 
 
@@ -243,13 +293,74 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
 
         x0, x1 = xdbl(P, A24), P
         for i in reversed(range(kbitlen-1)):
-            x0, x1 = CSWAP(x0, x1, kbits[i+1] ^ kbits[i])
+            x0, x1 = cswap(x0, x1, kbits[i+1] ^ kbits[i])
             x0, x1 = xdbl(x0, A24), xadd(x0, x1, P)
-        x0, x1 = CSWAP(x0, x1, kbits[0])
+        x0, x1 = cswap(x0, x1, kbits[0])
         
         return x0
 
 
+    # From this many points on, the batched kernels run on FpVector coordinates (one numpy call per
+    # Fp-operation for all points). Below it, looping over the points is faster: with gmpy2 the two
+    # break even around 128 points.
+    BATCH_VECTOR_MIN = 128
+    vector = FpVector(field)
+
+    def pack(points: list) -> tuple:
+        return (vector([X for X, _ in points]), vector([Z for _, Z in points]))
+
+    def unpack(P: tuple) -> list:
+        return list(zip(P[0], P[1]))
+
+    def xdbl_many(Ps: list, A24: tuple) -> list:
+        """[xdbl(P, A24) for P in Ps]"""
+        if len(Ps) >= BATCH_VECTOR_MIN:
+            return unpack(xdbl(pack(Ps), A24))
+        return [xdbl(P, A24) for P in Ps]
+
+    def xadd_many(Ps: list, Qs: list, PQs: list) -> list:
+        """[xadd(P, Q, PQ) for P, Q, PQ in zip(Ps, Qs, PQs)]"""
+        if len(Ps) >= BATCH_VECTOR_MIN:
+            return unpack(xadd(pack(Ps), pack(Qs), pack(PQs)))
+        return [xadd(P, Q, PQ) for P, Q, PQ in zip(Ps, Qs, PQs)]
+
+    def xmul_ladder_many(Ps: list, A24: tuple, j: int) -> list:
+        """
+        ----------------------------------------------------------------------
+        xmul_ladder_many(): [xmul_Ladder(P, A24, j) for P in Ps], as one ladder over all the points:
+        the bits of L[j] and the swap controls are computed once per step for all of them.
+        ----------------------------------------------------------------------
+        """
+        # Points at infinity are returned as they are, see xmul_Ladder()
+        finite = [i for i, P in enumerate(Ps) if P[1] != 0]
+        Qs = [(P[0], field(0)) for P in Ps]
+        if not finite:
+            return Qs
+        Ps_finite = [Ps[i] for i in finite]
+        kbits = binrep(L[j])
+        kbitlen = len(kbits)
+
+        if len(Ps_finite) >= BATCH_VECTOR_MIN:
+            # One ladder on the packed points
+            P = pack(Ps_finite)
+            x0, x1 = xdbl(P, A24), P
+            for i in reversed(range(kbitlen - 1)):
+                x0, x1 = cswap(x0, x1, kbits[i + 1] ^ kbits[i])
+                x0, x1 = xdbl(x0, A24), xadd(x0, x1, P)
+            x0, x1 = cswap(x0, x1, kbits[0])
+            x0 = unpack(x0)
+        else:
+            x0, x1 = xdbl_many(Ps_finite, A24), Ps_finite
+            for i in reversed(range(kbitlen - 1)):
+                x0, x1 = cswap(x0, x1, kbits[i + 1] ^ kbits[i])
+                x0, x1 = xdbl_many(x0, A24), xadd_many(x0, x1, Ps_finite)
+            x0, x1 = cswap(x0, x1, kbits[0])
+
+        for i, Q in zip(finite, x0):
+            Qs[i] = Q
+        return Qs
+
+
     def xmul_SDAC(P: tuple, A24: tuple, j: int) -> tuple:
         """
         ----------------------------------------------------------------------
@@ -259,8 +370,25 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
                 E : y^2 = x^3 + (A/C)*x^2 + x, and an positive integer j
         output: the projective Montgomery x-coordinate point x([L[j]]P)
         ----------------------------------------------------------------------
+        Costs 1 xdbl + (SDACS_LENGTH[j] + 1) xadd.
         """
-        raise NotImplementedError
+        XP, ZP = P
+        if ZP == 0:
+            return (XP, field(0))
+
+        # R[0] + R[1] = R[2], starting from (P, [2]P, [3]P)
+        P2 = xdbl(P, A24)
+        R = (P, P2, xadd(P2, P, P))
+        for b in SDACS_REVERSED[j]:
+            # Next term R[2] + R[b ^ 1], of difference R[b]
+            S, D = R[b ^ 1], R[b]
+            if D[1] == 0:
+                # D = O, so R[2] = S: only happens when P has a small order
+                T = xdbl(R[2], A24)
+            else:
+                T = xadd(R[2], S, D)
+            R = (S, R[2], T)
+        return R[2]
 
 
     def xmul_SDAC_safe(P: tuple, A24: tuple, j: int) -> tuple:
@@ -273,72 +401,481 @@ def MontgomeryCurve(prime_name="p1024_CTIDH", SDAC=False, validation="original")
                 E : y^2 = x^3 + (A/C)*x^2 + x, and an positive integer j
         output: the projective Montgomery x-coordinate point x([L[j]]P)
         ----------------------------------------------------------------------
+        Costs 1 xdbl + (SDACS_MAXLENGTH[j] + 1) xadd, which only depends on the batch of L[j].
         """
-        # NOTE: Use batch_maxdaclen to achieve security.
-        raise NotImplementedError
+        XP, ZP = P
+        if ZP == 0:
+            return (XP, field(0))
 
-    xmul_public = xmul_SDAC if SDAC else xmul_Ladder
-    xmul_private = xmul_SDAC_safe if SDAC else xmul_Ladder
+        dac, daclen = SDACS_INT[j], SDACS_LENGTH[j]
+        P2 = xdbl(P, A24)
+        R = (P, P2, xadd(P2, P, P))
+        Q = R[2]
+        collision = 0
+        for i in range(SDACS_MAXLENGTH[j]):
+            # Same step as xmul_SDAC(). Past the end of the chain the steps go on with zero bits,
+            # and only the points of the chain itself are kept in Q.
+            want = int(i < daclen)
+            S, D = cswap(R[0], R[1], ((dac >> i) & 1) ^ 1)
+            collision |= want & int(D[1] == 0)
+            R = (S, R[2], xadd(R[2], S, D))
+            Q = cmov(Q, R[2], want)
+
+        # NOTE: A collision (some difference D = O) means P has a small order, and the chain then ends in (0 : 0).
+        # The ladder handles it; this branch only depends on the order of P.
+        if collision:
+            return xmul_Ladder(P, A24, j)
+        return Q
+
+    def cladder(k: int):
+        """Cost [M, S, a] of xmul_int(P, A24, k): 1 xdbl + (bitlength(k) - 1) (xdbl + xadd)"""
+        b = k.bit_length()
+        return numpy.array([4.0 * (2 * b - 1), 2.0 * (2 * b - 1), 4.0 * b + 6.0 * (b - 1)])
+
+    def xmul_int(P: tuple, A24: tuple, k: int) -> tuple:
+        """
+        ----------------------------------------------------------------------
+        xmul_int(): Montgomery ladder for a PUBLIC positive integer k, branching on its bits
+        input : a projective Montgomery x-coordinate point x(P) := XP/ZP, the
+                projective Montgomery constants A24:= A + 2C and C24:=4C where
+                E : y^2 = x^3 + (A/C)*x^2 + x, and a positive integer k
+        output: the projective Montgomery x-coordinate point x([k]P)
+        ----------------------------------------------------------------------
+        """
+        XP, ZP = P
+        if ZP == 0:
+            return (XP, field(0))
+        # (x0, x1) = ([m]P, [m+1]P) for the leading bits m of k
+        x0, x1 = P, xdbl(P, A24)
+        for i in range(k.bit_length() - 2, -1, -1):
+            if (k >> i) & 1:
+                x0, x1 = xadd(x0, x1, P), xdbl(x1, A24)
+            else:
+                x0, x1 = xdbl(x0, A24), xadd(x0, x1, P)
+        return x0
 
-    # TODO: Add more useful things such as PRAC, eucild2d, cofactor_multiples, crisscross...
-    # Read papers and see sibc...
+    # PRAC chains (see utils.prac_chain()) for each l_i, computed the first time [l_i]P is asked for
+    PRAC_CHAINS = {}
 
+    def prac(j: int) -> list:
+        chain = PRAC_CHAINS.get(j)
+        if chain is None:
+            chain = PRAC_CHAINS[j] = prac_chain(L[j])
+        return chain
 
-    def issupersingular_original(A: tuple):
-        def order_rec(A24: tuple, Q: tuple, lower:int, upper:int, order:int):
-            # print(f'Calling order_rec with lower = {lower}, upper = {upper}')
-            if upper - lower == 1:
-                if Q[1] == 0:
-                    return order
-                
-                if not criticaltestdone:
-                    Q = xmul_public(Q, A24, lower) # scalarmult by l_upper
-                    if Q[1] == 0:
-                        return L[lower] * order
-                    else: # (p+1) * P != O, not supersingular!
-                        return 0
-            
-            mid = lower + (upper - lower + 1) // 2
-
-            Left = deepcopy(Q)
-            for i in range(lower, mid):
-                Left = xmul_public(Left, A24, i)
-
-            order = order_rec(A24, Left, mid, upper, order)
-            if order > int(4 * sqrt(p)):
-                return order
-            
-            Right = deepcopy(Q)
-            for i in range(mid, upper):
-                Right = xmul_public(Right, A24, i)
-
-            order = order_rec(A24, Right, lower, mid, order)    
-            return order
-        
-        A24 = xA24(A)
-        u = field.get_random()
-        P = (u, 1); P = xdbl(P, A24); P = xdbl(P, A24)
-        criticaltestdone = False # global wrt order_rec
+    def cprac(j: int):
+        """Cost [M, S, a] of xmul_PRAC(P, A24, j)"""
+        chain = prac(j)
+        dbl = sum(op[0] == "xdbl" for op in chain)
+        return numpy.array([4.0 * len(chain), 2.0 * len(chain), 4.0 * dbl + 6.0 * (len(chain) - dbl)])
 
-        order = order_rec(A24, P, 0, n, 1)
+    def xmul_PRAC(P: tuple, A24: tuple, j: int) -> tuple:
+        """
+        ----------------------------------------------------------------------
+        Scalar mult for PUBLIC primes that use Montgomery's PRAC chains
+        input : a projective Montgomery x-coordinate point x(P) := XP/ZP, the
+                projective Montgomery constants A24:= A + 2C and C24:=4C where
+                E : y^2 = x^3 + (A/C)*x^2 + x, and an positive integer j
+        output: the projective Montgomery x-coordinate point x([L[j]]P)
+        ----------------------------------------------------------------------
+        """
+        XP, ZP = P
+        if ZP == 0:
+            return (XP, field(0))
+
+        R = [P]
+        for op in prac(j):
+            if op[0] == "xdbl":
+                R.append(xdbl(R[op[1]], A24))
+            elif R[op[3]][1] == 0:
+                # The difference is O, so both points are the same: only happens when P has a small order
+                R.append(xdbl(R[op[1]], A24))
+            else:
+                R.append(xadd(R[op[1]], R[op[2]], R[op[3]]))
+        return R[-1]
+
+    # Plans of xmul_public_product(), per tuple of indices. The tuples change with every private batch set, so
+    # only the most recent ones are kept
+    @functools.lru_cache(maxsize=64)
+    def public_product_plan(indices: tuple) -> tuple:
+        """The cheapest way (w.r.t. measure()) to multiply by the product of L[j] for j in indices, among the
+        strategies the curve was built with: ("ladder", k) for one xmul_int() over the product k, always, and
+        ("SDAC", indices) for one SDAC per prime if SDAC, ("PRAC", indices) for one PRAC chain per prime if PRAC.
+        """
+        k = 1
+        for j in indices:
+            k *= L[j]
+        candidates = [(measure(cladder(k)), ("ladder", k))]
+        if SDAC:
+            candidates.append((sum(measure(c_xmul[j]) for j in indices), ("SDAC", indices)))
+        if PRAC:
+            candidates.append((sum(measure(cprac(j)) for j in indices), ("PRAC", indices)))
+        return min(candidates, key=lambda candidate: candidate[0])[1]
+
+    def xmul_public_product(P: tuple, A24: tuple, indices) -> tuple:
+        """
+        ----------------------------------------------------------------------
+        Scalar mult by the product of the PUBLIC primes L[j], j in indices,
+        following the cheapest plan for these indices (see public_product_plan()).
+        input : a projective Montgomery x-coordinate point x(P) := XP/ZP, the
+                projective Montgomery constants A24:= A + 2C and C24:=4C where
+                E : y^2 = x^3 + (A/C)*x^2 + x, and indices of L
+        output: the projective Montgomery x-coordinate point x([prod L[j]]P)
+        ----------------------------------------------------------------------
+        """
+        strategy, data = public_product_plan(tuple(indices))
+        if strategy == "ladder":
+            return xmul_int(P, A24, data)
+        xmul = xmul_SDAC if strategy == "SDAC" else xmul_PRAC
+        for j in data:
+            P = xmul(P, A24, j)
+        return P
+
+    def cofactor_tree(x, indices, mul):
+        """
+        Yield (i, x multiplied by the L[j], j in indices, j != i) for every i in indices, by a product tree:
+        each half of the indices is cleared from x once, then the other half recurses on it.
+        That is O(m log m) multiplications by the L[j] (m = len(indices)) instead of m^2.
+        mul(x, indices) multiplies x by the product of the L[j], j in indices (a scalar mult, an exponentiation...).
+        The upper half of the indices comes first. Stopping the iteration early skips the rest of the work.
+        """
+        if len(indices) <= 1:
+            yield from ((i, x) for i in indices)
+            return
+        mid = (len(indices) + 1) // 2
+        yield from cofactor_tree(mul(x, indices[:mid]), indices[mid:], mul)
+        yield from cofactor_tree(mul(x, indices[mid:]), indices[:mid], mul)
+
+    def cofactor_multiples_iter(P: tuple, A24: tuple, lo: int, hi: int):
+        """Yield (i, [prod of L[j], j in [lo, hi), j != i] P) for every i in [lo, hi), see cofactor_tree()."""
+        return cofactor_tree(P, range(lo, hi), lambda Q, indices: xmul_public_product(Q, A24, indices))
+
+    def cofactor_multiples(P: tuple, A24: tuple, lo: int, hi: int) -> list:
+        """[[prod of L[j], j in [lo, hi), j != i] P for i in range(lo, hi)], see cofactor_multiples_iter()."""
+        multiples = [None] * (hi - lo)
+        for i, Q in cofactor_multiples_iter(P, A24, lo, hi):
+            multiples[i - lo] = Q
+        return multiples
+
+    # Per-function attribution of the Fp-operations, see ZModPrime.counting(). Nothing is wrapped without counting.
+    if field.counted:
+        xdbl, xadd, xmul_Ladder, elligator = map(field.attributed, (xdbl, xadd, xmul_Ladder, elligator))
+        elligator_many, elligator_table = map(field.attributed, (elligator_many, elligator_table))
+        xmul_SDAC, xmul_SDAC_safe = map(field.attributed, (xmul_SDAC, xmul_SDAC_safe))
+        xmul_int, xmul_PRAC, xmul_public_product = map(field.attributed, (xmul_int, xmul_PRAC, xmul_public_product))
+        xmul_ladder_many = field.attributed(xmul_ladder_many)
+
+    xmul_public = xmul_PRAC if PRAC else xmul_SDAC if SDAC else xmul_Ladder
+    xmul_private = xmul_SDAC_safe if SDAC else xmul_Ladder
+    if SDAC:
+        def xmul_private_many(Ps: list, A24: tuple, j: int) -> list:
+            return [xmul_SDAC_safe(P, A24, j) for P in Ps]
+    else:
+        xmul_private_many = xmul_ladder_many
+
+    # TODO: Euclid2D chains (see sibc) for the public scalar mults, next to SDAC and PRAC.
 
-        if order == 0:
-            return False
-        elif order > int(4 * sqrt(p)):
-            return True
-        else:
-            print('Original validation algorithm failed. This should almost never happen. Retry now.')
-            issupersingular_original(A)
 
+    sqrt_bound = isqrt(16 * p)  # int(4 * sqrt(p))
+
+    def issingular(A: tuple) -> bool:
+        """A = +-2: y^2 = x (x +- 1)^2 is not an elliptic curve, and no validation may accept it."""
+        Ax, Az = A
+        t = Az + Az
+        return Ax == t or Ax == -t
+
+    def validate_original(A: tuple, max_retries: int = 4) -> attrdict:
+        """
+        The original test, with a bounded number of retries: [p+1]P = O and the l_i-parts of the order of a random
+        P in E(GF(p)), found with cofactor_multiples_iter(), multiply to more than 4 sqrt(p).
+        Then the exponent of E(GF(p)), hence #E(GF(p)), is p+1 by Hasse's bound.
+        A new point is drawn only if the order of P is too small to conclude. The l_i found so far still divide the
+        exponent, so they are cleared from the new point by one xmul_public_product() and only the others are searched.
+        After max_retries new points, issupersingular_doliskani() decides.
+        ----------------------------------------------------------------------
+        Returns attrdict(supersingular, retries, xmuls, fallback): the verdict, the number of new points drawn after
+        the first one, the number of scalar multiplications (xmul_public and xmul_public_product) spent and
+        whether issupersingular_doliskani() was needed. The singular A = +-2 is rejected without any of them.
+        """
+        A24 = xA24(A)
+        found = []  # the i with l_i dividing the exponent of E(GF(p))
+        order = 1
+        xmuls = 0
+
+        def mul(Q, indices):
+            nonlocal xmuls
+            xmuls += 1
+            return xmul_public_product(Q, A24, indices)
+
+        def verdict(supersingular, fallback=False):
+            return attrdict(supersingular=supersingular, retries=retries, xmuls=xmuls, fallback=fallback)
+
+        retries = 0
+        # Its smooth points form a group of order p+1, which would pass the test below
+        if issingular(A):
+            return verdict(False)
+
+        for retries in range(max_retries + 1):
+            P = (field.get_random(), field(1))
+            for _ in range(k):
+                P = xdbl(P, A24)
+            if found:
+                P = mul(P, found)
+            if P[1] == 0:  # Nothing to learn from P
+                continue
+            for i, Q in cofactor_tree(P, [i for i in range(n) if i not in found], mul):
+                if Q[1] == 0:
+                    continue
+                Q = xmul_public(Q, A24, i)  # scalarmult by l_i
+                xmuls += 1
+                if Q[1] != 0:  # (p+1) * P != O, not supersingular!
+                    return verdict(False)
+                found.append(i)
+                order *= L[i]
+                if order > sqrt_bound:
+                    return verdict(True)
+        return verdict(issupersingular_doliskani(A), True)
+
+    def issupersingular_original(A: tuple) -> bool:
+        return validate_original(A).supersingular
+
+    field2 = Fp2(field)
 
     def issupersingular_doliskani(A: tuple):
-        raise NotImplementedError
+        """Doliskani's test: E_A is supersingular iff E(GF(p^2)) = E[p+1], so iff [p+1]P = O for a random P in E(GF(p^2)).
+        An ordinary curve passes only if P happens to have an order dividing p+1, which is negligible.
+        Costs one x-only [p+1] over GF(p^2), where xdbl/xadd cost about 3 times as much as over GF(p).
+        """
+        Ax, Az = A
+        A24 = xA24(A)
+        while True:
+            # x(P) for a P in E(GF(p^2)): x^3 + A x^2 + x must be a square of GF(p^2), as must be its product with Az^2,
+            # and Az (in GF(p)) is a square of GF(p^2): test Az x^3 + Ax x^2 + Az x.
+            x = field2.get_random()
+            rhs = x * Az
+            rhs += Ax
+            rhs *= x
+            rhs += Az
+            rhs *= x
+            # rhs = 0 would give a point of order 2
+            if rhs != 0 and rhs.is_square_fast():
+                break
+
+        P = (x, field2(1))
+        for _ in range(k):
+            P = xdbl(P, A24)
+        P = xmul_public_product(P, A24, range(n))  # [p+1]P, as p+1 = 2^k * L[0] * ... * L[n-1]
+        return P[1] == 0
 
-    def issupersingular_pairing1(A: tuple):
-        raise NotImplementedError
+    # Pairing-based validation: the reduced Tate pairing of P in E(GF(p)) with a trace-zero point Q of E(GF(p^2)),
+    # i.e. Q = (xQ, yQ*i) with xQ, yQ in GF(p), which comes from a point (xQ, yQ) of the quadratic twist y^2 = -(x^3 + a x^2 + x).
+    # Its order divides the order of P, so a pairing of order > 4 sqrt(p) dividing p+1 proves #E(GF(p)) = p+1.
+    # Points are affine (x, y), T in the Miller loop is homogeneous (X : Y : Z), with Z = 0 for O.
 
-    def issupersingular_pairing2(A: tuple):
-        raise NotImplementedError
+    def random_point_with_y(a, twist: bool) -> tuple:
+        """A random (x, y) with y^2 = x^3 + a x^2 + x (or -(x^3 + a x^2 + x) if twist) and y != 0."""
+        while True:
+            x = field.get_random()
+            rhs = x + a
+            rhs *= x
+            rhs += 1
+            rhs *= x
+            if rhs != 0 and rhs.is_square_fast() != twist:
+                return (x, (-rhs if twist else rhs).sqrt())
+
+    def miller_dbl(T: tuple, Q: tuple, a) -> tuple:
+        """[2]T and the tangent line at T evaluated at Q (up to a factor in GF(p)), T != O and y(T) != 0."""
+        X, Y, Z = T
+        xQ, yQ = Q
+        # slope n / d = (3x^2 + 2ax + 1) / 2y
+        t = X * Z
+        n = X ** 2
+        n += n + n
+        t2 = a * t
+        n += t2 + t2
+        ZZ = Z ** 2
+        n += ZZ
+        d = Y * Z
+        d += d
+        # line: (d Z yQ) i - (Y d + n (xQ Z - X))
+        line_re = xQ * Z
+        line_re -= X
+        line_re *= n
+        line_re += Y * d
+        line = field2._new(-line_re, d * Z * yQ)
+        # [2]T = (u d : n (X d^2 - u) - Y d^3 : d^3 Z), u = n^2 Z - (a Z + 2X) d^2
+        dd = d ** 2
+        ddd = dd * d
+        u = a * Z
+        u += X + X
+        u *= dd
+        u = n ** 2 * Z - u
+        Y2 = X * dd
+        Y2 -= u
+        Y2 *= n
+        Y2 -= Y * ddd
+        return (u * d, Y2, ddd * Z), line
+
+    def miller_add(T: tuple, P: tuple, Q: tuple, a):
+        """T + P and the line through T and P evaluated at Q (up to a factor in GF(p)), or None if T = P.
+        The line is None when it is vertical (T = -P), which the final exponentiation would cancel anyway.
+        """
+        X, Y, Z = T
+        xP, yP = P
+        xQ, yQ = Q
+        # slope n / d = (yP - y) / (xP - x)
+        n = yP * Z
+        n -= Y
+        d = xP * Z
+        d -= X
+        if d == 0:
+            if n == 0:
+                return None
+            return (field(0), field(1), field(0)), None
+        # line: (d yQ) i - (d yP + n (xQ - xP))
+        line_re = xQ - xP
+        line_re *= n
+        line_re += d * yP
+        line = field2._new(-line_re, d * yQ)
+        # T + P = (u d : n (xP d^2 Z - u) - yP d^3 Z : d^3 Z), u = n^2 Z - (a Z + X + xP Z) d^2
+        dd = d ** 2
+        dddZ = dd * d
+        dddZ *= Z
+        xPZ = xP * Z
+        u = a * Z
+        u += X
+        u += xPZ
+        u *= dd
+        u = n ** 2 * Z - u
+        Y3 = xPZ * dd
+        Y3 -= u
+        Y3 *= n
+        Y3 -= yP * dddZ
+        return (u * d, Y3, dddZ), line
+
+    def miller_loop(P: tuple, Q: tuple, a, m: int) -> tuple:
+        """
+        Miller's loop for f_{m,P}(Q) on E : y^2 = x^3 + a x^2 + x, P = (xP, yP) in E(GF(p)) and Q = (xQ, yQ)
+        standing for the trace-zero point (xQ, yQ*i). Lines are scaled by elements of GF(p) and vertical lines
+        are skipped: both vanish in the final exponentiation of the reduced Tate pairing.
+        Returns (f, [m]P), f in GF(p^2).
+        """
+        f = field2(1)
+        T = (P[0], P[1], field(1))
+        for i in range(m.bit_length() - 2, -1, -1):
+            f **= 2
+            if T[2] != 0:
+                if T[1] == 0:
+                    T = (field(0), field(1), field(0))  # 2-torsion, vertical tangent
+                else:
+                    T, line = miller_dbl(T, Q, a)
+                    f *= line
+            if (m >> i) & 1:
+                if T[2] == 0:
+                    T = (P[0], P[1], field(1))  # O + P, vertical line
+                    continue
+                added = miller_add(T, P, Q, a)
+                if added is None:
+                    # T = P
+                    T = (P[0], P[1], field(1))
+                    T, line = miller_dbl(T, Q, a)
+                else:
+                    T, line = added
+                if line is not None:
+                    f *= line
+        return f, T
+
+    def tate_pairing(P: tuple, Q: tuple, a, m: int):
+        """Reduced Tate pairing f_{m,P}(Q) ^ ((p^2 - 1) / m) for m dividing p + 1, in the norm-1 subgroup of GF(p^2).
+        None if [m]P != O.
+        """
+        f, T = miller_loop(P, Q, a, m)
+        if T[2] != 0:
+            return None
+        # f^(p-1) = conj(f) / f
+        z = f.conjugate() * ~f
+        return z.unitary_pow((p + 1) // m)
+
+    def issupersingular_pairing1(A: tuple, max_retries: int = 4):
+        """Pairing-based test: the reduced Tate pairing z of order dividing p+1 of random P in E(GF(p)) and
+        trace-zero Q. E is not supersingular if [p+1]P != O. Otherwise the order of z is found from the odd
+        primes up with cofactor_tree(), until it exceeds 4 sqrt(p), which proves #E(GF(p)) = p+1.
+        After max_retries new pairs of points, issupersingular_doliskani() decides.
+        """
+        if issingular(A):
+            return False
+        Ax, Az = A
+        a = Ax * ~Az
+        for _ in range(max_retries + 1):
+            P = random_point_with_y(a, False)
+            Q = random_point_with_y(a, True)
+            z = tate_pairing(P, Q, a, p + 1)
+            if z is None:
+                return False
+            for _ in range(k):
+                z = z.unitary_square()
+            # Now the order of z divides L[0] * ... * L[n-1]
+            order = 1
+            for i, w in cofactor_tree(z, range(n), lambda w, indices: w.unitary_pow(prod(L[j] for j in indices))):
+                if w != 1:
+                    order *= L[i]
+                    if order > sqrt_bound:
+                        return True
+            # The order of z is too small to conclude (P or Q lack some l-part): retry with other points
+        return issupersingular_doliskani(A)
+
+    # The largest l_i whose product exceeds 4 sqrt(p), used by issupersingular_pairing2()
+    pairing2_start = n
+    while prod(L[pairing2_start:]) <= sqrt_bound:
+        pairing2_start -= 1
+    pairing2_order = prod(L[pairing2_start:])
+
+    def affine_point_with_y(P: tuple, a, twist: bool):
+        """(x, y) from the x-only P, None if P = O. As in random_point_with_y(), y^2 = x^3 + a x^2 + x (negated if twist)."""
+        if P[1] == 0:
+            return None
+        x = P[0] * ~P[1]
+        rhs = x + a
+        rhs *= x
+        rhs += 1
+        rhs *= x
+        return (x, (-rhs if twist else rhs).sqrt())
+
+    def issupersingular_pairing2(A: tuple, max_retries: int = 4):
+        """Pairing-based test with a shorter Miller loop: P and Q are first multiplied (x-only) by the cofactor of M,
+        the product of the largest l_i, just above 4 sqrt(p). If the pairing of order M of the resulting points
+        exists and has order M, #E(GF(p)) = p+1. E is not supersingular if [M]P != O.
+        After max_retries new pairs of points, issupersingular_doliskani() decides.
+        """
+        if issingular(A):
+            return False
+        Ax, Az = A
+        a = Ax * ~Az
+        A24 = xA24(A)
+        for _ in range(max_retries + 1):
+            points = []
+            for twist in [False, True]:
+                x, _ = random_point_with_y(a, twist)
+                R = (x, field(1))
+                for _ in range(k):
+                    R = xdbl(R, A24)
+                R = xmul_public_product(R, A24, range(pairing2_start))
+                points.append(affine_point_with_y(R, a, twist))
+            P, Q = points
+            if P is None:
+                # Only possible for an ordinary E or a P of small order; the pairing would not conclude
+                continue
+            if Q is None:
+                continue
+            z = tate_pairing(P, Q, a, pairing2_order)
+            if z is None:
+                return False
+            if all(w != 1 for _, w in cofactor_tree(
+                z, range(pairing2_start, n), lambda w, indices: w.unitary_pow(prod(L[j] for j in indices))
+            )):
+                return True
+            # The order of z is smaller than M: retry with other points
+        return issupersingular_doliskani(A)
 
     validation_options = {
         "original": issupersingular_original,
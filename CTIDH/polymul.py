@@ -65,16 +65,13 @@ def PolyMul(field, maxdeg = None, mindeg = 64):
             # XXX 57k
             # Multiplication of linear polynomials over fp
             # Thus c(x) = (a * b)(x) is a quadratic polynomial
-            c = [0, 0, 0]
-
-            c[0] = (f[0] * g[0])  # coeff of x^0
-            c[2] = (f[1] * g[1])  # coeff of x^2
-            f01 = (f[0] + f[1])
-            g01 = (g[0] + g[1])
-            c[1] = (f01 * g01)
-            c[1] -= c[0]
-            c[1] -= c[2]  # coeff of x^1
-            return c
+            c0 = (f[0] * g[0])  # coeff of x^0
+            c2 = (f[1] * g[1])  # coeff of x^2
+            c1 = (f[0] + f[1])
+            c1 *= (g[0] + g[1])
+            c1 -= c0
+            c1 -= c2  # coeff of x^1
+            return [c0, c1, c2]
 
         if flen == 3:
 
@@ -82,21 +79,16 @@ def PolyMul(field, maxdeg = None, mindeg = 64):
             if glen == 2:
 
                 # g(x) is a linear polynomial
-                c = list(
-                    [0, 0, 0, 0]
-                )  # Thus c(x) = (f * g)(x) is a cubic polynomial
-
-                c[0] = (f[0] * g[0])  # coeff of x^0
-                c[2] = (f[1] * g[1])
-                f01 = (f[0] + f[1])
-                g01 = (g[0] + g[1])
-                c[1] = (f01 * g01)
-                c[1] -= c[0]
-                c[1] -= c[2]  # coeff of x^1
-                c[3] = (f[2] * g[1])  # coeff of x^3
-                f2g0 = (f[2] * g[0])
-                c[2] += f2g0  # coeff of x^2
-                return c
+                # Thus c(x) = (f * g)(x) is a cubic polynomial
+                c0 = (f[0] * g[0])  # coeff of x^0
+                c2 = (f[1] * g[1])
+                c1 = (f[0] + f[1])
+                c1 *= (g[0] + g[1])
+                c1 -= c0
+                c1 -= c2  # coeff of x^1
+                c3 = (f[2] * g[1])  # coeff of x^3
+                c2 += (f[2] * g[0])  # coeff of x^2
+                return [c0, c1, c2, c3]
 
             if glen == 3:
                 # XXX 24k but recursion
@@ -112,11 +104,8 @@ def PolyMul(field, maxdeg = None, mindeg = 64):
                 # Middle part
                 f_01 = (f[0] + f[1])
                 f_02 = (f[0] + f[2])
-                g_01 = (g[0] + g[1])
-                g_02 = (g[0] + g[2])
-
-                f_01 *= g_01 # t_01
-                f_02 *= g_02 # t_02
+                f_01 *= (g[0] + g[1]) # t_01
+                f_02 *= (g[0] + g[2]) # t_02
 
                 f_01 -= karatsuba_0[0] # t_01 - karat # l_coeff
                 f_01 -= karatsuba_1[0] # l_coeff
@@ -1,15 +1,442 @@
-from sage.all import GF, proof, is_prime
-from sage.rings.finite_rings.integer_mod import IntegerMod_gmp, IntegerMod_int
+from .utils import attrdict, bitlength, hamming_weight, memoize, exponent_chains, read_exponent_chains
 
-from .utils import bitlength, hamming_weight, memoize, CMOV
+import functools
+from contextlib import contextmanager
 
-import copy
+import secrets
 
-proof.arithmetic(False)
+import numpy
+
+# Sage is only needed by the (default) "sage" backend, gmpy2 only by the "gmpy2" backend.
+try:
+    from sage.all import GF, proof, is_prime, kronecker_symbol
+    from sage.rings.finite_rings.integer_mod import IntegerMod_gmp, IntegerMod_int
+
+    proof.arithmetic(False)
+except ImportError:
+    GF = None
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+# Bernstein-Yang safegcd, see "Fast constant-time gcd computation and modular inversion" (TCHES 2019).
+DIVSTEPS_BATCH = 62  # divsteps done on the low bits before updating the full-size values
+
+
+def divsteps_bound(bits: int) -> int:
+    """Number of divsteps that always suffices to reach g = 0 for inputs of the given bitlength (Theorem 11.2 of the paper)."""
+    return (49 * bits + 80) // 17 if bits < 46 else (49 * bits + 57) // 17
+
+
+# The 2x2 transition matrix is packed into the two rows F = f + u*2^W + v*2^(2W), G = g + q*2^W + r*2^(2W).
+# Instead of halving g, the f-row is doubled every step, so every update below is linear on the packed rows.
+_W = 256
+_W_MASK = (1 << _W) - 1
+_W_HALF = 1 << (_W - 1)
+
+
+def _unpack(X: int) -> tuple:
+    lo = ((X + _W_HALF) & _W_MASK) - _W_HALF
+    X = (X - lo) >> _W
+    hi = ((X + _W_HALF) & _W_MASK) - _W_HALF
+    return hi, (X - hi) >> _W
+
+
+def _divsteps(n: int, delta: int, f: int, g: int) -> tuple:
+    """n branch-free divsteps on the low bits f, g (f odd). Return delta and (u, v, q, r) with
+    2^n * (f_n, g_n) = (u*f + v*g, q*f + r*g) for the full-size f, g.
+    """
+    F = f | (1 << _W)
+    G = g | (1 << (2 * _W))
+    for i in range(n):
+        c = (G >> i) & 1
+        mask = -(c & ((-delta) >> 63))  # -1 if delta > 0 and g is odd, else 0
+        # if mask: (delta, f, g) = (-delta, g, -f)
+        delta = (delta ^ mask) - mask + 1
+        t = (F ^ G) & mask
+        F ^= t
+        G ^= t
+        G = (G ^ mask) - mask
+        # g = (g + c*f) / 2, done as g += c*f, f *= 2
+        G += F & -c
+        F <<= 1
+    return (delta,) + _unpack(F) + _unpack(G)
+
+
+def safegcd_invert(x: int, p: int, steps: int) -> int:
+    """Constant-time x^(-1) mod p, p an odd prime, by a fixed number of divsteps.
+
+    Args:
+        x (int): the element to invert, in [0, p). 0 is mapped to 0 like the Fermat inversion.
+        p (int): the modulus
+        steps (int): number of divsteps, a multiple of DIVSTEPS_BATCH that is at least divsteps_bound(bitlength(p))
+    """
+    low = (1 << DIVSTEPS_BATCH) - 1
+    # Invariant: 2^i * f = d * x and 2^i * g = e * x (mod p) after i divsteps
+    f, g, d, e, delta = p, x, 0, 1, 1
+    for _ in range(steps // DIVSTEPS_BATCH):
+        delta, u, v, q, r = _divsteps(DIVSTEPS_BATCH, delta, f & low, g & low)
+        f, g = (u * f + v * g) >> DIVSTEPS_BATCH, (q * f + r * g) >> DIVSTEPS_BATCH
+        d, e = (u * d + v * e) % p, (q * d + r * e) % p
+    # Now g = 0 and f = +-gcd(x, p) = +-1
+    return d * f * pow(2, -steps, p) % p
+
+
+class ZModPrimeBase:
+    """Backend-independent part of ZModPrime.
+
+    Everything here is written in terms of the arithmetic operators, so it is shared by all backends.
+    The concrete classes are created by PrimeField() and hold their own counters.
+    """
+    __slots__ = ()
+
+    add_count = 0
+    sqr_count = 0
+    mul_count = 0
+    pow_count = 0
+    inv_count = 0
+
+    counted = True  # False if the class never touches its counters
+    backend = None
+    _p = None
+    _prime_name = None
+    _new = None  # staticmethod(value -> element) skipping the type dispatch of __init__, set by PrimeField()
+    _jacobi = None  # staticmethod(value -> Jacobi symbol (value | p)), set by PrimeField()
+    _select = None  # staticmethod((value_a, value_b, bit) -> value_b if bit else value_a) without branching, set by PrimeField()
+
+    _chains = None  # chains for the fixed exponents, see exponent_chains(), set by PrimeField()
+    _fixed_exponents = None  # {"p-2": p-2, "(p-1)/2": (p-1)/2, "(p+1)/4": (p+1)/4}, set by PrimeField()
+
+    inversion = "fermat"  # "fermat" or "safegcd", see set_inversion()
+    safegcd_steps = None  # divsteps done by the safegcd inversion, set by set_inversion()
+
+    def __radd__(self, other):
+        return self + other
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __rmul__(self, other):
+        return self * other
+
+    # TODO: Maybe implment div rdiv and idiv?
+    def __div__(self, other):
+        raise NotImplementedError
+
+    def __rdiv__(self, other):
+        raise NotImplementedError
+
+    def __idiv__(self, other):
+        raise NotImplementedError
+
+    def safe_pow(self, e:int, e_maxbitlen:int):
+        """Timing-safe powmod. Return a ZModPrime with value self.value ** e
+
+        Args:
+            e (int): the exponent
+            e_maxbitlen (int): the possible max value of e's bitlength.
+
+        NOTE: To achieve timing-safe property, this function runs a Montgomery ladder over e_maxbitlen bits whatever e is.
+        Costs e_maxbitlen S + (e_maxbitlen - 1) M.
+        """
+        if self.counted:
+            type(self).pow_count += 1
+        return ZModPrimeBase._ladder((self,), e, e_maxbitlen)[0]
+
+    @classmethod
+    def safe_pow2(cls, a, b, e:int, e_maxbitlen:int) -> tuple:
+        """(a.safe_pow(e, e_maxbitlen), b.safe_pow(e, e_maxbitlen)) in a single ladder over the bits of e."""
+        if cls.counted:
+            cls.pow_count += 2
+        return tuple(ZModPrimeBase._ladder((a, b), e, e_maxbitlen))
+
+    @staticmethod
+    def _ladder(bases: tuple, e: int, e_maxbitlen: int) -> list:
+        # Montgomery ladder keeping (R0, R1) = (x^k, x^(k+1)) for the leading bits k of e, for each base x.
+        # The bits only select between references, nothing is copied or branched on.
+        assert 1 <= e_maxbitlen and bitlength(e) <= e_maxbitlen
+        bit = (e >> (e_maxbitlen - 1)) & 1
+        states = []
+        for x in bases:
+            x_copy = x.copy()
+            states.append(((type(x)(1), x_copy), (x_copy, x ** 2))[bit])
+
+        for i in range(e_maxbitlen - 2, -1, -1):
+            bit = (e >> i) & 1
+            for j, (R0, R1) in enumerate(states):
+                R0, R1 = ((R0, R1), (R1, R0))[bit]
+                R1 = R0 * R1
+                R0 = R0 ** 2
+                states[j] = ((R0, R1), (R1, R0))[bit]
+
+        return [R0 for R0, _ in states]
+
+    def pow_chain(self, chain: list):
+        """self ** e following a sliding-window chain for e (see sliding_window_chain()).
+        The Fp-operations counted are exactly those of the chain.
+        """
+        if self.counted:
+            type(self).pow_count += 1
+        max_digit = max(digit for _, digit in chain)
+        table = {1: self}  # odd powers self^1, self^3, ..., self^max_digit
+        if max_digit > 1:
+            square = self ** 2
+            for digit in range(3, max_digit + 1, 2):
+                table[digit] = table[digit - 2] * square
+
+        ans = table[chain[0][1]].copy()
+        for squarings, digit in chain[1:]:
+            for _ in range(squarings):
+                ans **= 2
+            if digit != 0:
+                ans *= table[digit]
+        return ans
+
+    def _pow_fixed(self, name: str):
+        """self ** e for one of the fixed exponents e of the field ("p-2", "(p-1)/2" or "(p+1)/4"), by its precomputed chain."""
+        if not self.counted:
+            # Nothing to count: let the backend's own exponentiation do it
+            return self ** self._fixed_exponents[name]
+        return self.pow_chain(self._chains[name])
+
+    def __invert__(self):
+        if self.counted:
+            type(self).inv_count += 1
+        if self.inversion == "safegcd":
+            # Not an Fp-multiplication chain, so only inv_count is increased
+            return type(self)(safegcd_invert(int(self.value), self._p, self.safegcd_steps))
+        return self._pow_fixed("p-2")
+
+    @classmethod
+    def set_inversion(cls, mode: str, steps: int = None):
+        """Choose the algorithm behind __invert__.
+
+        Args:
+            mode (str): "fermat" computes self ** (p-2) (the default), "safegcd" runs a fixed number
+                of Bernstein-Yang divsteps.
+            steps (int, optional): number of divsteps of the safegcd mode. Defaults to divsteps_bound(bitlength(p)).
+                It is rounded up to a multiple of DIVSTEPS_BATCH.
+        """
+        if mode not in ["fermat", "safegcd"]:
+            raise ValueError(f"No such inversion mode: {mode}")
+        if steps is None:
+            steps = divsteps_bound(bitlength(cls._p))
+        elif steps < divsteps_bound(bitlength(cls._p)):
+            raise ValueError(f"{steps} divsteps are not enough for a {bitlength(cls._p)}-bit prime")
+        cls.inversion = mode
+        cls.safegcd_steps = -(-steps // DIVSTEPS_BATCH) * DIVSTEPS_BATCH
+
+    @classmethod
+    def batch_invert(cls, elems: list) -> list:
+        """Invert all the elements at once with Montgomery's simultaneous-inversion trick.
+
+        N inversions cost one inversion and 3(N-1) multiplications.
+
+        Args:
+            elems (list): nonzero ZModPrime (or int) elements
+
+        Raises:
+            ZeroDivisionError: if some element is zero
+        """
+        if len(elems) == 0:
+            return []
+        elems = [e if isinstance(e, cls) else cls(e) for e in elems]
+
+        # prefix[i] = elems[0] * ... * elems[i]
+        prefix = [elems[0]]
+        for e in elems[1:]:
+            prefix.append(prefix[-1] * e)
+        if prefix[-1] == 0:
+            raise ZeroDivisionError("batch_invert: cannot invert zero!")
+
+        inv = ~prefix[-1] # (elems[0] * ... * elems[i])^(-1), i from N-1 down to 0
+        ret = [None] * len(elems)
+        for i in range(len(elems) - 1, 0, -1):
+            ret[i] = inv * prefix[i - 1]
+            inv *= elems[i]
+        ret[0] = inv
+        return ret
+
+    def __str__(self):
+        return 'ZModPrime {} mod {}'.format(self.value, self._prime_name)
+
+    def __repr__(self):
+        return str(self)
+
+    def get_int_value(self):
+        return int(self.value)
+
+    def copy(self):
+        return self._new(self.value)
+
+    def is_square(self) -> bool:
+        legendre_symbol = self._pow_fixed("(p-1)/2")
+        return True if legendre_symbol == 1 else False
+
+    def sqrt(self):
+        """A square root of self, computed as self ** ((p+1)/4) since p = 3 mod 4.
+
+        Raises:
+            ValueError: if self is not a square
+        """
+        root = self._pow_fixed("(p+1)/4")
+        if root ** 2 != self:
+            raise ValueError(f"{self} is not a square!")
+        return root
+
+    def is_square_fast(self) -> bool:
+        """Same as is_square(), but with a Jacobi symbol instead of a (p-1)/2 exponentiation.
+
+        The Jacobi symbol is computed by a gcd-like (variable-time) algorithm, so it is applied to the
+        blinded value self * r^2 for a fresh random r != 0. This has the same Legendre symbol, and it is a uniformly random
+        (non-)residue whatever self is. Costs 1M + 1S.
+        """
+        r = self.get_random()
+        while r == 0:
+            r = self.get_random()
+        blinded = r ** 2
+        blinded *= self
+        return self._jacobi(blinded.value) == 1
+
+    # Per-function attribution, active inside counting(by_function=True)
+    _attribution = None  # {function name: [M, S, a, P, I, calls]} of the operations done by the function itself
+    _children = None  # stack of the operations done by the callees of the attributed functions being run
+
+    @classmethod
+    def _snapshot(cls) -> tuple:
+        return (cls.mul_count, cls.sqr_count, cls.add_count, cls.pow_count, cls.inv_count)
+
+    @classmethod
+    @contextmanager
+    def counting(cls, by_function: bool = False):
+        """Count the Fp-operations done inside a with-block:
+
+            with field.counting() as c:
+                ...
+            c.M, c.S, c.a, c.P, c.I
+
+        Scopes can be nested, and they leave the class counters (show_runtime etc.) untouched.
+
+        Args:
+            by_function (bool, optional): also fill c.by_function with the operations done by each function wrapped
+                by attributed() (xdbl, xadd, xmul_Ladder, elligator, kps_t, xisog_t, xeval_t, ...), excluding the
+                operations of the wrapped functions they call. Defaults to False.
+        """
+        if not cls.counted:
+            raise ValueError("This field does not count its operations, create it with counting=True.")
+        if by_function and cls._attribution is not None:
+            raise ValueError("Per-function attribution is already active in an outer scope.")
+
+        c = attrdict()
+        start = cls._snapshot()
+        if by_function:
+            cls._attribution = {}
+            cls._children = []
+        try:
+            yield c
+        finally:
+            c.update(zip(("M", "S", "a", "P", "I"), (x - y for x, y in zip(cls._snapshot(), start))))
+            if by_function:
+                c["by_function"] = {
+                    name: attrdict(zip(("M", "S", "a", "P", "I", "calls"), counts))
+                    for name, counts in cls._attribution.items()
+                }
+                cls._attribution = None
+                cls._children = None
+
+    @classmethod
+    def attributed(cls, f):
+        """Wrap f so that counting(by_function=True) reports the Fp-operations done by f under f.__name__.
+        Outside such a scope the wrapper only forwards the call. Never needed when the class does not count.
+        """
+        name = f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            attribution = cls._attribution
+            if attribution is None:
+                return f(*args, **kwargs)
+            start = cls._snapshot()
+            cls._children.append([0] * 5)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                children = cls._children.pop()
+                inclusive = [x - y for x, y in zip(cls._snapshot(), start)]
+                counts = attribution.setdefault(name, [0] * 6)
+                for i in range(5):
+                    counts[i] += inclusive[i] - children[i]
+                counts[5] += 1
+                if cls._children:
+                    parent = cls._children[-1]
+                    for i in range(5):
+                        parent[i] += inclusive[i]
+
+        return wrapper
+
+    @classmethod
+    def reset_runtime(cls):
+        cls.add_count = 0
+        cls.sqr_count = 0
+        cls.mul_count = 0
+
+    @classmethod
+    def reset_power_invert_time(cls):
+        cls.pow_count = 0
+        cls.inv_count = 0
+
+    @classmethod
+    def show_runtime(cls, label: str):
+        print(
+            "| %s: %7dM + %7dS + %7da"
+            % (label, cls.mul_count, cls.sqr_count, cls.add_count),
+            end="\n",
+        )
+
+    @classmethod
+    def show_sqr_pow(cls, label: str):
+        print(
+            "| %s: %2dP + %2dI" % (label, cls.pow_count, cls.inv_count),
+            end="\n",
+        )
+
+
+def _fixed_exponent_chains(p: int, prime_name: str) -> dict:
+    # Use the chains of data/chains/ if they are for this p, generate them otherwise.
+    chains = read_exponent_chains(prime_name)
+    if chains is None or chains["p"] != p:
+        chains = exponent_chains(p)
+    return chains
 
 
 @memoize
-def PrimeField(p: int):
+def PrimeField(p: int, backend: str = "sage", counting: bool = True):
+    """Return the class ZModPrime of elements of GF(p).
+
+    Args:
+        p (int): the characteristic.
+        backend (str, optional): "sage" wraps Sage's IntegerMod (the reference implementation),
+            "gmpy2" works on reduced gmpy2.mpz residues. Defaults to "sage".
+        counting (bool, optional): count the Fp-operations in the class attributes
+            add_count, sqr_count, mul_count, pow_count and inv_count. Only the gmpy2 backend
+            can run without counting, in which case the counters are never touched. Defaults to True.
+    """
+    if backend not in ["sage", "gmpy2"]:
+        raise ValueError(f"No such field backend: {backend}")
+
+    prime_name = 'p1024_CTIDH' if p.bit_length() <= 1025 else 'p2048_CTIDH'
+
+    if backend == "gmpy2":
+        return _gmpy2_prime_field(p, counting, prime_name)
+
+    if GF is None:
+        raise ImportError("The sage backend of PrimeField requires sagemath.")
+    if not counting:
+        raise ValueError("Only the gmpy2 backend can run with counting switched off.")
+
     if not is_prime(p):
         raise ArithmeticError("Cannot construct Fp: p is not a prime!")
 
@@ -35,7 +462,10 @@ def PrimeField(p: int):
     #           return f(x.value, other)
     #   return wrapper
 
-    class ZModPrime:
+    class ZModPrime(ZModPrimeBase):
+        # No __dict__ per element: millions of them are created in a group action
+        __slots__ = ("value",)
+
         add_count = 0
         sqr_count = 0
         mul_count = 0
@@ -45,6 +475,8 @@ def PrimeField(p: int):
         pow_count = 0
         inv_count = 0
         _p = p
+        _prime_name = prime_name
+        backend = "sage"
         # p = p
 
         # self.value always has the type IntegerMod_gmp when p is large or IntegerMod_int
@@ -64,10 +496,7 @@ def PrimeField(p: int):
         def __add__(self, other):
             ZModPrime.add_count += 1
             other = get_value(other)
-            return ZModPrime(self.value + other)
-
-        def __radd__(self, other):
-            return self + other
+            return new(self.value + other)
 
         def __iadd__(self, other):
             ZModPrime.add_count += 1
@@ -78,10 +507,7 @@ def PrimeField(p: int):
         def __sub__(self, other):
             ZModPrime.add_count += 1
             other = get_value(other)
-            return ZModPrime(self.value - other)
-
-        def __rsub__(self, other):
-            return -self + other
+            return new(self.value - other)
 
         def __isub__(self, other):
             ZModPrime.add_count += 1
@@ -92,10 +518,7 @@ def PrimeField(p: int):
         def __mul__(self, other):
             ZModPrime.mul_count += 1
             other = get_value(other)
-            return ZModPrime(self.value * other)
-
-        def __rmul__(self, other):
-            return self * other
+            return new(self.value * other)
 
         def __imul__(self, other):
             ZModPrime.mul_count += 1
@@ -103,16 +526,6 @@ def PrimeField(p: int):
             self.value = self.value * other
             return self
 
-        # TODO: Maybe implment div rdiv and idiv?
-        def __div__(self, other):
-            raise NotImplementedError
-
-        def __rdiv__(self, other):
-            raise NotImplementedError
-
-        def __idiv__(self, other):
-            raise NotImplementedError
-
         def __pow__(self, e: int):
             # TODO: write a faster constant-time power if it is slow
             # Can we use a nearly optimal addition chain here?
@@ -138,20 +551,20 @@ def PrimeField(p: int):
                     - It allows negative exponents, but any exponent is expected to belong to |[ 0 .. p - 1 ]|
             """
             if e == 0:
-                return ZModPrime(1)
-            
+                return new(GFp(1))
+
             elif e > 0: # e > 0
                 ZModPrime.sqr_count += bitlength(e) - 1
                 ZModPrime.mul_count += hamming_weight(e) - 1
                 if e > 2: # e > 2
                     ZModPrime.pow_count += 1
-                return ZModPrime(self.value ** e)
+                return new(self.value ** e)
 
             # Seems that this is the only case when e<0 in CSIDH.
             elif e == -1:
                 # ~ indicate invert
                 return ~self
-            
+
             else:
                 raise NotImplementedError('Unexpected behavior: performing a ** e, e < -1 in CTIDH.')
 
@@ -167,112 +580,522 @@ def PrimeField(p: int):
                     ZModPrime.mul_count += hamming_weight(e) - 1
                 self.value **= e
                 return self
-            
+
             elif e == 0:  # e == 0
-                self.value = 1
+                self.value = GFp(1)
                 return self
-            
+
             else: # e < 0
                 raise NotImplementedError('Unexpected behavior: performing a **= e, e < 0 in CTIDH.')
 
-        def safe_pow(self, e:int, e_maxbitlen:int):
-            """Timing-safe powmod. Return a ZModPrime with value self.value ** e
+        def __neg__(self):
+            return new(-self.value)
 
-            Args:
-                e (int): the exponent
-                e_maxbitlen (int): the possible max value of e's bitlength. 
+        def __eq__(self, other):
+            other = get_value(other)
+            return self.value == other
 
-            NOTE: To achieve timing-safe property, this function pretends to compute the case exponent equals 2**e_maxbitlen
+        @classmethod
+        def get_random(cls):
+            return new(GFp.random_element())
 
-            """
-            ZModPrime.pow_count += 1
-            
-            a = self
-            tmp1 = copy.deepcopy(self) # a ** padded_e
-            tmp2 = copy.deepcopy(self) 
-            e_bitlen = bitlength(e)
-
-            padded_e = e << (e_maxbitlen - e_bitlen)
-            ans = copy.deepcopy(self)
-            # tmp and ans have initial value a
-            # start from the second MSB
-            for i in range(2, e_maxbitlen+1):
-                tmp1 = tmp1 ** 2
-                tmp2 = tmp1 * a
-                should_mov = (padded_e >> (e_maxbitlen - i)) & 1 # if 1 then mov, if 0 then don't move
-                tmp1 = CMOV(tmp1, tmp2, should_mov)
-
-                ans = CMOV(ans, tmp1, i <= e_bitlen)
-            
-            return ans
-                
-        def __invert__(self):
-            # TODO: write a faster constant-time invert.
-            # Currently we use self.x**(p-2).
-            self.inv_count += 1
-            return self ** (ZModPrime._p - 2)
+    # Skips the type dispatch of __init__, value must already be an element of GFp.
+    def new(value):
+        ret = object.__new__(ZModPrime)
+        ret.value = value
+        return ret
+
+    ZModPrime._new = staticmethod(new)
+    ZModPrime._jacobi = staticmethod(lambda value: kronecker_symbol(value.lift(), p))
+    # IntegerMod has no bitwise operators, so select arithmetically
+    ZModPrime._select = staticmethod(lambda a, b, bit: a + (b - a) * bit)
+    ZModPrime._chains = _fixed_exponent_chains(p, prime_name)
+    ZModPrime._fixed_exponents = {"p-2": p - 2, "(p-1)/2": (p - 1) // 2, "(p+1)/4": (p + 1) // 4}
+    ZModPrime.__name__ = f'ZModPrime with p = {prime_name}'
+
+    return ZModPrime
+
+
+def _gmpy2_prime_field(p: int, counting: bool, prime_name: str):
+    """ZModPrime on gmpy2.mpz residues in [0, p), used as the fast backend of PrimeField().
+
+    Without counting this is the class returned, and none of its operators touches a counter.
+    With counting, a subclass wraps the operators to count them the same way as the sage backend.
+    """
+    if gmpy2 is None:
+        raise ImportError("The gmpy2 backend of PrimeField requires gmpy2.")
+    if not gmpy2.is_prime(p):
+        raise ArithmeticError("Cannot construct Fp: p is not a prime!")
+
+    mpz = gmpy2.mpz
+    powmod = gmpy2.powmod
+    p = mpz(p)
+
+    # other can have type ZModPrime, int or mpz
+    def get_value(other):
+        if isinstance(other, ZModPrime):
+            return other.value
+        elif isinstance(other, int) or type(other) is mpz:
+            return other
+        else:
+            raise TypeError(
+                "Cannot get the value of (type:{}) {}!".format(type(other), other)
+            )
+
+    class ZModPrime(ZModPrimeBase):
+        __slots__ = ("value",)
+
+        add_count = 0
+        sqr_count = 0
+        mul_count = 0
+        pow_count = 0
+        inv_count = 0
+        _p = int(p)
+        _prime_name = prime_name
+        backend = "gmpy2"
+        counted = False
+
+        # self.value always has the type mpz and lies in [0, p)
+        def __init__(self, elem):
+            if isinstance(elem, ZModPrime):
+                self.value = elem.value
+            elif isinstance(elem, int) or type(elem) is mpz:
+                self.value = mpz(elem) % p
+            else:
+                raise TypeError(
+                    "Cannot convert {} type {} to a ZModPrime!".format(type(elem), elem)
+                )
+
+        def __add__(self, other):
+            return new((self.value + get_value(other)) % p)
+
+        def __iadd__(self, other):
+            self.value = (self.value + get_value(other)) % p
+            return self
+
+        def __sub__(self, other):
+            return new((self.value - get_value(other)) % p)
+
+        def __isub__(self, other):
+            self.value = (self.value - get_value(other)) % p
+            return self
+
+        def __mul__(self, other):
+            return new((self.value * get_value(other)) % p)
+
+        def __imul__(self, other):
+            self.value = (self.value * get_value(other)) % p
+            return self
+
+        def __pow__(self, e: int):
+            if e == 2:  # much cheaper than powmod
+                return new(self.value * self.value % p)
+            elif e >= 0:
+                return new(powmod(self.value, e, p))
+            # Seems that this is the only case when e<0 in CSIDH.
+            elif e == -1:
+                return ~self
+            else:
+                raise NotImplementedError('Unexpected behavior: performing a ** e, e < -1 in CTIDH.')
+
+        def __ipow__(self, e: int):
+            if e == 2:
+                self.value = self.value * self.value % p
+                return self
+            elif e >= 0:
+                self.value = powmod(self.value, e, p)
+                return self
+            else:
+                raise NotImplementedError('Unexpected behavior: performing a **= e, e < 0 in CTIDH.')
 
         def __neg__(self):
-            return ZModPrime(-self.value)
+            return new((-self.value) % p)
 
         def __eq__(self, other):
-            other = get_value(other)
-            return self.value == other
-        
+            return self.value == get_value(other) % p
+
+        @classmethod
+        def get_random(cls):
+            return new(mpz(secrets.randbelow(p)))
+
+    Uncounted = Field = ZModPrime
+
+    if counting:
+        class ZModPrime(Uncounted):
+            __slots__ = ()
+
+            add_count = 0
+            sqr_count = 0
+            mul_count = 0
+            pow_count = 0
+            inv_count = 0
+            counted = True
+
+            def __add__(self, other):
+                ZModPrime.add_count += 1
+                return Uncounted.__add__(self, other)
+
+            def __iadd__(self, other):
+                ZModPrime.add_count += 1
+                return Uncounted.__iadd__(self, other)
+
+            def __sub__(self, other):
+                ZModPrime.add_count += 1
+                return Uncounted.__sub__(self, other)
+
+            def __isub__(self, other):
+                ZModPrime.add_count += 1
+                return Uncounted.__isub__(self, other)
+
+            def __mul__(self, other):
+                ZModPrime.mul_count += 1
+                return Uncounted.__mul__(self, other)
+
+            def __imul__(self, other):
+                ZModPrime.mul_count += 1
+                return Uncounted.__imul__(self, other)
+
+            # Same counting rules as the sage backend: left-to-right square-and-multiply
+            def __pow__(self, e: int):
+                if e > 0:
+                    ZModPrime.sqr_count += bitlength(e) - 1
+                    ZModPrime.mul_count += hamming_weight(e) - 1
+                    if e > 2:
+                        ZModPrime.pow_count += 1
+                return Uncounted.__pow__(self, e)
+
+            def __ipow__(self, e: int):
+                if e > 0:
+                    ZModPrime.sqr_count += bitlength(e) - 1
+                    if e > 2:
+                        ZModPrime.pow_count += 1
+                        ZModPrime.mul_count += hamming_weight(e) - 1
+                return Uncounted.__ipow__(self, e)
+
+        Field = ZModPrime
+
+    # Skips the type dispatch of __init__, value must already be a reduced mpz.
+    def new(value):
+        ret = object.__new__(Field)
+        ret.value = value
+        return ret
+
+    Field._new = staticmethod(new)
+    Field._jacobi = staticmethod(lambda value: gmpy2.jacobi(value, p))
+    Field._select = staticmethod(lambda a, b, bit: a ^ ((a ^ b) & -bit))
+    Field._chains = _fixed_exponent_chains(int(p), prime_name)
+    Field._fixed_exponents = {"p-2": p - 2, "(p-1)/2": (p - 1) // 2, "(p+1)/4": (p + 1) // 4}
+    Field.__name__ = f'ZModPrime with p = {prime_name} (gmpy2{"" if counting else ", no counting"})'
+
+    return Field
+
+
+@memoize
+def FpVector(field):
+    """Return the class FpVector of fixed-length vectors over the field returned by PrimeField().
+
+    The residues are kept in one numpy object array, so an elementwise operation on N entries is a
+    single numpy call instead of N ZModPrime dispatches and allocations. Every entry is still
+    counted as one Fp-operation: N entries cost N additions / multiplications / squarings.
+    """
+    if field.backend == "gmpy2":
+        p = gmpy2.mpz(field._p)
+
+        def reduce(values):
+            return values % p
+    else:
+        # Sage's IntegerMod values are always reduced
+        def reduce(values):
+            return values
+
+    one = field(1).value
+
+    # other can have type FpVector, ZModPrime or int
+    def get_values(other):
+        if isinstance(other, FpVector):
+            return other.values
+        elif isinstance(other, field):
+            return other.value
+        elif isinstance(other, int):
+            return other
+        else:
+            raise TypeError(
+                "Cannot get the value of (type:{}) {}!".format(type(other), other)
+            )
+
+    def count(name, n):
+        if field.counted:
+            setattr(field, name, getattr(field, name) + n)
+
+    class FpVector:
+        __slots__ = ("values",)
+
+        # elems is an iterable of ZModPrime or int
+        def __init__(self, elems):
+            elems = list(elems)
+            self.values = numpy.empty(len(elems), dtype=object)
+            self.values[:] = [field(e).value if isinstance(e, int) else e.value for e in elems]
+
+        def __len__(self):
+            return len(self.values)
+
+        def __getitem__(self, i):
+            if isinstance(i, slice):
+                return new(self.values[i])
+            return field._new(self.values[i])
+
+        def __iter__(self):
+            return map(field._new, self.values)
+
+        def to_list(self) -> list:
+            return list(self)
+
+        def __add__(self, other):
+            count("add_count", len(self))
+            return new(reduce(self.values + get_values(other)))
+
+        def __sub__(self, other):
+            count("add_count", len(self))
+            return new(reduce(self.values - get_values(other)))
+
+        def __mul__(self, other):
+            count("mul_count", len(self))
+            return new(reduce(self.values * get_values(other)))
+
+        __radd__ = __add__
+        __rmul__ = __mul__
+
+        def __rsub__(self, other):
+            count("add_count", len(self))
+            return new(reduce(get_values(other) - self.values))
+
+        def __iadd__(self, other):
+            count("add_count", len(self))
+            self.values = reduce(self.values + get_values(other))
+            return self
+
+        def __isub__(self, other):
+            count("add_count", len(self))
+            self.values = reduce(self.values - get_values(other))
+            return self
+
+        def __imul__(self, other):
+            count("mul_count", len(self))
+            self.values = reduce(self.values * get_values(other))
+            return self
+
+        def __neg__(self):
+            return new(reduce(-self.values))
+
+        def __pow__(self, e: int):
+            if e != 2:
+                raise NotImplementedError('FpVector only supports squaring.')
+            count("sqr_count", len(self))
+            return new(reduce(self.values * self.values))
+
+        def cmov(self, other, mask):
+            """Entrywise CMOV: the entries of other (an FpVector or a scalar) where mask is True, those of self elsewhere.
+
+            mask is a boolean sequence of length len(self). Every entry is selected, whatever the mask.
+            """
+            if isinstance(other, int):
+                other = field(other)
+            return new(numpy.where(mask, get_values(other), self.values))
+
+        def prod(self):
+            """Product of all entries, as a ZModPrime. The empty product is 1.
+
+            Computed as a balanced product tree (one vector multiplication per level), costing len(self) - 1 multiplications.
+            """
+            values = self.values
+            if len(values) == 0:
+                return field._new(one)
+            while len(values) > 1:
+                h = len(values) // 2
+                count("mul_count", h)
+                paired = reduce(values[:h] * values[h:2*h])
+                values = numpy.concatenate((paired, values[2*h:])) if len(values) & 1 else paired
+            return field._new(values[0])
+
+        @staticmethod
+        def concatenate(vectors):
+            """The entries of all the vectors, one after the other, as one FpVector. No Fp-operation."""
+            return new(numpy.concatenate([v.values for v in vectors]))
+
+        def tile(self, m: int):
+            """The vector repeated m times, i.e. m consecutive blocks equal to self. No Fp-operation."""
+            return new(numpy.tile(self.values, m))
+
+        def repeat(self, n: int):
+            """Every entry repeated n times in a row, i.e. one block of length n per entry. No Fp-operation."""
+            return new(numpy.repeat(self.values, n))
+
+        def prod_blocks(self, m: int):
+            """Products of the m consecutive blocks of len(self) // m entries, as an FpVector of length m.
+
+            The same product tree as prod(), run on all the blocks at once: m * (len(self) // m - 1) multiplications.
+            """
+            assert len(self.values) % m == 0
+            n = len(self.values) // m
+            if n == 0:
+                return new(numpy.full(m, one, dtype=object))
+            values = self.values.reshape(m, n)
+            while values.shape[1] > 1:
+                h = values.shape[1] // 2
+                count("mul_count", m * h)
+                paired = reduce(values[:, :h] * values[:, h:2*h])
+                values = numpy.concatenate((paired, values[:, 2*h:]), axis=1) if values.shape[1] & 1 else paired
+            return new(values[:, 0].copy())
+
+    # Skips the conversion in __init__, values must already be a numpy array of reduced residues.
+    def new(values):
+        ret = object.__new__(FpVector)
+        ret.values = values
+        return ret
+
+    FpVector._new = staticmethod(new)
+    FpVector.__name__ = f'FpVector over {field.__name__}'
+
+    return FpVector
+
+
+@memoize
+def Fp2(field):
+    """Return the class Fp2 of the elements re + im*i of GF(p^2) = GF(p)[i] / (i^2 + 1), over the field returned by PrimeField().
+
+    Since p = 3 mod 4, -1 is not a square in GF(p) and i^2 = -1 defines GF(p^2). The coordinates are elements of field,
+    so the Fp-operations behind each Fp2-operation are counted by field: a product costs 3M (Karatsuba), a square 2M,
+    a product by an element of GF(p) 2M.
+    """
+
+    # other can have type Fp2, ZModPrime or int
+    def coordinates(other):
+        if isinstance(other, Fp2):
+            return other.re, other.im
+        elif isinstance(other, (field, int)):
+            return other, None
+        else:
+            raise TypeError(
+                "Cannot get the value of (type:{}) {}!".format(type(other), other)
+            )
+
+    class Fp2:
+        __slots__ = ("re", "im")
+
+        # re and im are ZModPrime or int
+        def __init__(self, re, im=0):
+            self.re = re.copy() if isinstance(re, field) else field(re)
+            self.im = im.copy() if isinstance(im, field) else field(im)
+
         def __str__(self):
-            return 'ZModPrime {} mod {}'.format(self.value, prime_name)
-        
+            return f"{self.re} + {self.im}*i"
+
         def __repr__(self):
             return str(self)
 
-        def get_int_value(self):
-            return int(self.value)
-
         def copy(self):
-            ret = object.__new__(ZModPrime)
-            ret.value = self.value
-            return ret
+            return new(self.re.copy(), self.im.copy())
 
-        def is_square(self) -> bool:
-            legendre_symbol = self ** ( (ZModPrime._p - 1) // 2)
-            return True if legendre_symbol == 1 else False
+        def __add__(self, other):
+            re, im = coordinates(other)
+            return new(self.re + re, self.im.copy() if im is None else self.im + im)
 
-        def is_square_fast(self) -> bool:
-            # TODO: Implement this CCS' 23 algorithm.
-            raise NotImplementedError('Fast algorithm not implemented yet!')
+        def __sub__(self, other):
+            re, im = coordinates(other)
+            return new(self.re - re, self.im.copy() if im is None else self.im - im)
 
-        @classmethod
-        def get_random(cls):
-            return ZModPrime(GFp.random_element())
+        def __rsub__(self, other):
+            return -self + other
 
+        def __mul__(self, other):
+            re, im = coordinates(other)
+            if im is None:
+                return new(self.re * re, self.im * re)
+            # Karatsuba: (a + bi)(c + di) = (ac - bd) + ((a + b)(c + d) - ac - bd)i
+            t0 = self.re * re
+            t1 = self.im * im
+            t2 = self.re + self.im
+            t2 *= re + im
+            t2 -= t0
+            t2 -= t1
+            t0 -= t1
+            return new(t0, t2)
 
-        @classmethod
-        def reset_runtime(cls):
-            cls.add_count = 0
-            cls.sqr_count = 0
-            cls.mul_count = 0
+        __radd__ = __add__
+        __rmul__ = __mul__
 
-        @classmethod
-        def reset_power_invert_time(cls):
-            cls.pow_count = 0
-            cls.inv_count = 0
+        def __pow__(self, e: int):
+            if e != 2:
+                raise NotImplementedError('Fp2 only supports squaring.')
+            # (a + bi)^2 = (a + b)(a - b) + 2abi
+            re = self.re + self.im
+            re *= self.re - self.im
+            im = self.re * self.im
+            im += im
+            return new(re, im)
 
-        @classmethod
-        def show_runtime(cls, label: str):
-            print(
-                "| %s: %7dM + %7dS + %7da"
-                % (label, cls.mul_count, cls.sqr_count, cls.add_count),
-                end="\n",
-            )
+        def __neg__(self):
+            return new(-self.re, -self.im)
+
+        def __eq__(self, other):
+            re, im = coordinates(other)
+            return self.re == re and self.im == (0 if im is None else im)
+
+        def conjugate(self):
+            return new(self.re.copy(), -self.im)
+
+        def norm(self):
+            """self * self^p = re^2 + im^2, as a ZModPrime"""
+            n = self.re ** 2
+            n += self.im ** 2
+            return n
+
+        def __invert__(self):
+            n = ~self.norm()
+            return new(self.re * n, -(self.im * n))
+
+        def unitary_square(self):
+            """self ** 2 for self of norm 1 (re^2 + im^2 = 1): (2re^2 - 1) + ((re + im)^2 - 1)i, costs 2S."""
+            re = self.re ** 2
+            re += re
+            re -= 1
+            im = self.re + self.im
+            im **= 2
+            im -= 1
+            return new(re, im)
+
+        def unitary_pow(self, e: int):
+            """self ** e for self of norm 1 and e >= 0, by left-to-right square-and-multiply with unitary_square()."""
+            if e == 0:
+                return new(field(1), field(0))
+            ans = self
+            for i in range(e.bit_length() - 2, -1, -1):
+                ans = ans.unitary_square()
+                if (e >> i) & 1:
+                    ans = ans * self
+            return ans.copy() if ans is self else ans
+
+        def is_square(self) -> bool:
+            """A nonzero element of GF(p^2) is a square iff its norm is a square in GF(p)."""
+            return self.norm().is_square()
+
+        def is_square_fast(self) -> bool:
+            """Same as is_square(), with ZModPrime.is_square_fast() for the norm."""
+            return self.norm().is_square_fast()
 
         @classmethod
-        def show_sqr_pow(cls, label: str):
-            print(
-                "| %s: %2dP + %2dI" % (label, cls.pow_count, cls.inv_count),
-                end="\n",
-            )
+        def get_random(cls):
+            return new(field.get_random(), field.get_random())
 
-    prime_name = 'p1024_CTIDH' if p.bit_length() <= 1025 else 'p2048_CTIDH'
-    ZModPrime.__name__ = f'ZModPrime with p = {prime_name}'
+    # Skips the conversions in __init__, re and im must already be fresh elements of field.
+    def new(re, im):
+        ret = object.__new__(Fp2)
+        ret.re = re
+        ret.im = im
+        return ret
 
-    return ZModPrime
+    Fp2._new = staticmethod(new)
+    Fp2.field = field
+    Fp2.__name__ = f'Fp2 over {field.__name__}'
+
+    return Fp2
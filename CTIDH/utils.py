@@ -1,8 +1,10 @@
+import collections
+import inspect
 import json
+import os
 import random
 import time
 from functools import reduce
-import copy
 
 import numpy as np
 # Dictionary which provides attribute access to its keys.
@@ -25,9 +27,13 @@ isequal = {True: 1, False: 0}  # Simulating constant-time integer comparison
 # instances of a number class.
 def memoize(f):
     cache = {}
+    signature = inspect.signature(f)
 
     def memoizedFunction(*args, **kwargs):
-        argTuple = args + tuple(kwargs)
+        # Bind to the signature so that f(x) and f(x, default=...) share one entry
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        argTuple = tuple(bound.arguments.items())
         if argTuple not in cache:
             cache[argTuple] = f(*args, **kwargs)
         return cache[argTuple]
@@ -53,18 +59,48 @@ def binrep(k: int) -> list:
     return bin_rep
 
 
-# conditional MOV, return a
-# Note that this PoC implementation does not implement CMOV and CSWAP carefully,
-# Maybe it should be implement in another way to make sure it safe.
-def CMOV(a, b, control: bool):
-    b_copy = copy.deepcopy(b)
-    return b_copy if control else a
-
-
-def CSWAP(a, b, control: bool):
-    if control:
-        a, b = b, a
-    return a, b
+# Conditional move and swap by masking, for ZModPrime elements, FpVectors, ints, and tuples/lists of them
+# (projective points, curve coefficients). Nothing is deep-copied and there is no branch on control:
+# integers are masked with -control, field elements through the _select() of their backend.
+# NOTE: this is still Python, so it is timing-safe only as far as the underlying big-integer operations are.
+def cmov(a, b, control):
+    """Return b if control else a. control is a bool or 0/1."""
+    if isinstance(a, (tuple, list)):
+        return type(a)(cmov(x, y, control) for x, y in zip(a, b))
+    if isinstance(a, int) and isinstance(b, int):
+        return a ^ ((a ^ b) & -int(control))
+    if hasattr(a, "cmov"):
+        # FpVector
+        return a.cmov(b, bool(control))
+    # At least one of a, b is a ZModPrime
+    field = type(a) if hasattr(a, "_select") else type(b)
+    a, b = _as_element(field, a), _as_element(field, b)
+    return field._new(field._select(a.value, b.value, int(control)))
+
+
+def cswap(a, b, control):
+    """Return (b, a) if control else (a, b). control is a bool or 0/1."""
+    if isinstance(a, (tuple, list)):
+        x, y = zip(*[cswap(x, y, control) for x, y in zip(a, b)])
+        return type(a)(x), type(b)(y)
+    if isinstance(a, int) and isinstance(b, int):
+        mask = (a ^ b) & -int(control)
+        return a ^ mask, b ^ mask
+    if hasattr(a, "cmov"):
+        return cmov(a, b, control), cmov(b, a, control)
+    field = type(a) if hasattr(a, "_select") else type(b)
+    a, b = _as_element(field, a).value, _as_element(field, b).value
+    control = int(control)
+    return field._new(field._select(a, b, control)), field._new(field._select(b, a, control))
+
+
+def _as_element(field, x):
+    return x if isinstance(x, field) else field(x)
+
+
+# Old names
+CMOV = cmov
+CSWAP = cswap
 
 
 def read_prime_info(prime_name="p2048_CTIDH"):
@@ -110,7 +146,7 @@ def read_velusqrt_steps_info(prime_name="p2048_CTIDH", scaled=True):
     sI_list = []
     sJ_list = []
 
-    steps_info_path = f"data/prime_info/{prime_name}" + suffix
+    steps_info_path = f"data/steps/{prime_name}" + suffix
     with open(steps_info_path, 'r') as f:
         steps = f.readlines()
 
@@ -129,6 +165,27 @@ def read_velusqrt_steps_info(prime_name="p2048_CTIDH", scaled=True):
     return sI_list, sJ_list
 
 
+def velu_formulae_path(prime_name="p2048_CTIDH", scaled=False, backend="sage") -> str:
+    suffix = '_scaled' if scaled else '_unscaled'
+    return f"data/formulae/{prime_name}{suffix}_{backend}"
+
+
+def read_velu_formulae_info(prime_name="p2048_CTIDH", scaled=False, backend="sage"):
+    """The formula, 'tvelu' or 'svelu', measured as the fastest for each l by benchmarks/tune_velu.py on the given field
+    backend, as a dict {l: formula}. None if there is no table for these parameters.
+
+    Each line of the table is "l formula tvelu_ops svelu_ops tvelu_us svelu_us", lines starting with # are comments.
+    """
+    try:
+        with open(velu_formulae_path(prime_name, scaled, backend)) as f:
+            lines = [line.split() for line in f if line.strip() and not line.startswith('#')]
+    except FileNotFoundError:
+        return None
+    formulae = {int(line[0]): line[1] for line in lines}
+    assert set(formulae.values()) <= {'tvelu', 'svelu'}
+    return formulae
+
+
 def read_SDAC_info(prime_name='p2048_CTIDH'):
     SDAC_info = []
     with open(f"data/sdacs/{prime_name}", 'r') as f:
@@ -137,6 +194,166 @@ def read_SDAC_info(prime_name='p2048_CTIDH'):
     return SDAC_info
 
 
+def sliding_window_chain(e: int, w: int) -> list:
+    """Left-to-right sliding-window chain for x^e, e > 0.
+
+    Returns a list of [squarings, digit] pairs: start from x^digit of the first pair (whose squarings is 0),
+    then for each next pair square that many times and multiply by x^digit (no multiplication if digit is 0).
+    Digits are odd and smaller than 2^w.
+    """
+    assert e > 0
+    bits = bin(e)[2:]
+    chain = []
+    squarings = 0
+    i = 0
+    while i < len(bits):
+        if bits[i] == '0':
+            squarings += 1
+            i += 1
+            continue
+        # the longest window of at most w bits starting at i and ending with a 1
+        j = min(i + w, len(bits))
+        while bits[j - 1] == '0':
+            j -= 1
+        squarings += j - i
+        chain.append([squarings if chain else 0, int(bits[i:j], 2)])
+        squarings = 0
+        i = j
+    if squarings > 0:
+        chain.append([squarings, 0])
+    return chain
+
+
+def chain_cost(chain: list) -> tuple:
+    """Return (#multiplications, #squarings) of evaluating the chain, including the table of odd powers."""
+    max_digit = max(digit for _, digit in chain)
+    mul = (max_digit - 1) // 2 + sum(1 for _, digit in chain[1:] if digit != 0)
+    sqr = (1 if max_digit > 1 else 0) + sum(squarings for squarings, _ in chain)
+    return mul, sqr
+
+
+def exponent_chains(p: int, max_window: int = 8) -> dict:
+    """The cheapest sliding-window chains (S = M) for the fixed exponents of GF(p):
+    p-2 (inversion), (p-1)/2 (Legendre symbol) and (p+1)/4 (square root, p = 3 mod 4).
+    """
+    exponents = {"p-2": p - 2, "(p-1)/2": (p - 1) // 2, "(p+1)/4": (p + 1) // 4}
+    chains = {"p": p}
+    for name, e in exponents.items():
+        candidates = [sliding_window_chain(e, w) for w in range(1, max_window + 1)]
+        chains[name] = min(candidates, key=lambda chain: sum(chain_cost(chain)))
+    return chains
+
+
+# Montgomery's choices of r / k for PRAC (as in GMP-ECM), golden ratio first
+PRAC_RATIOS = [
+    0.61803398874989485, 0.72360679774997897, 0.58017872829546410, 0.63283980608870629, 0.61242994950949500,
+    0.62018198080741576, 0.61721461653440386, 0.61939563737354441, 0.61851056851779613, 0.61817409657265506,
+]
+
+
+def _prac_chain(k: int, r: int):
+    """PRAC chain for [k]P from the split k = r + (k - r), or None if it fails for this r.
+
+    The chain is a list of ops, the i-th op writing [m_i]P to slot i + 1 of a list starting with [P]:
+    ["xdbl", src] or ["xadd", p, q, diff] where slot diff holds the difference of slots p and q,
+    or in a few steps their sum, and then the op gives their difference.
+    [k]P is the last slot.
+    """
+    ops = []
+    mult = [1]  # m_i of each slot, to check the chain
+
+    def xdbl(src):
+        ops.append(["xdbl", src])
+        mult.append(2 * mult[src])
+        return len(mult) - 1
+
+    def xadd(p, q, diff):
+        # x-only, so the sum and the difference of [m_p]P and [m_q]P play symmetric roles
+        ops.append(["xadd", p, q, diff])
+        if mult[diff] == abs(mult[p] - mult[q]):
+            mult.append(mult[p] + mult[q])
+        else:
+            assert mult[diff] == mult[p] + mult[q]
+            mult.append(abs(mult[p] - mult[q]))
+        return len(mult) - 1
+
+    # A, B, C are slots with C = A - B, T and T2 are temporaries (GMP-ECM's prac)
+    d, e = k - r, 2 * r - k
+    B = C = 0
+    A = xdbl(0)
+    while d != e:
+        if e <= 0 or len(ops) > 4 * k.bit_length():
+            return None
+        if d < e:
+            d, e = e, d
+            A, B = B, A
+        if 4 * d <= 5 * e and (d + e) % 3 == 0:
+            d, e = (2 * d - e) // 3, (e - (2 * d - e) // 3) // 2
+            T = xadd(A, B, C)
+            T2 = xadd(T, A, B)
+            B = xadd(B, T, A)
+            A = T2
+        elif 4 * d <= 5 * e and (d - e) % 6 == 0:
+            d = (d - e) // 2
+            B = xadd(A, B, C)
+            A = xdbl(A)
+        elif d <= 4 * e:
+            d -= e
+            B, C = xadd(B, A, C), B
+        elif (d + e) % 2 == 0:
+            d = (d - e) // 2
+            B = xadd(B, A, C)
+            A = xdbl(A)
+        elif d % 2 == 0:
+            d //= 2
+            C = xadd(C, A, B)
+            A = xdbl(A)
+        elif d % 3 == 0:
+            d = d // 3 - e
+            T = xdbl(A)
+            T2 = xadd(A, B, C)
+            A = xadd(T, A, A)
+            B, C = xadd(T, T2, C), B
+        elif (d + e) % 3 == 0:
+            d = (d - 2 * e) // 3
+            T = xadd(A, B, C)
+            B = xadd(T, A, B)
+            A = xadd(A, xdbl(A), A)
+        elif (d - e) % 3 == 0:
+            d = (d - e) // 3
+            T = xadd(A, B, C)
+            C = xadd(C, A, B)
+            B = T
+            A = xadd(A, xdbl(A), A)
+        elif e % 2 == 0:
+            e //= 2
+            C = xadd(C, B, A)
+            B = xdbl(B)
+        else:
+            return None
+    xadd(A, B, C)
+    return ops if mult[-1] == k else None
+
+
+def prac_chain(k: int) -> list:
+    """Montgomery's PRAC differential chain for [k]P, k odd and > 1: the shortest chain over PRAC_RATIOS
+    (fewest xdbl + xadd, then fewest xadd). See _prac_chain() for the format.
+    """
+    chains = [_prac_chain(k, int(k * ratio + 0.5)) for ratio in PRAC_RATIOS]
+    chains = [chain for chain in chains if chain is not None]
+    assert chains, f"No PRAC chain for {k}"
+    return min(chains, key=lambda chain: (len(chain), sum(op[0] == "xadd" for op in chain)))
+
+
+def read_exponent_chains(prime_name="p2048_CTIDH"):
+    """Chains written by precompute_prime_info.py, see exponent_chains(). None if there is no file for prime_name."""
+    try:
+        with open(f"data/chains/{prime_name}") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
 # return the batch number of the batch that L[i] belongs to.
 def batchnumber_of_Li(i:int, batch_start: list, batch_stop: list):
     for j in range(len(batch_start)):
@@ -161,3 +378,117 @@ def batchminprime_of_Li(i: int, batch_start: list, batch_stop: list, L:list):
 def get_randint(a: int, b: int):
     random.seed(time.time())
     return random.randint(a, b)
+
+
+class VerdictCache:
+    """Bounded LRU cache of boolean verdicts, e.g. public key -> is supersingular.
+
+    Entries older than ttl seconds (None: never) are dropped on lookup. If store is a path, verdicts are also
+    appended to that file, one "key verdict timestamp" line each, and the file is read back on construction so that
+    they survive restarts. Whoever can write the store can make keys pass validation: keep it private.
+    The store is rewritten with the live entries only when it is loaded with dead (expired, superseded or evicted)
+    lines, and whenever it grows past 2 maxsize lines, so that it stays bounded. Malformed lines (e.g. a write cut
+    short by a crash) are skipped and count as dead.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None, store: str = None, clock=time.time):
+        if maxsize <= 0:
+            raise ValueError(f"maxsize must be positive, got {maxsize}")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.store = store
+        self.clock = clock
+        self.entries = collections.OrderedDict()  # key -> (verdict, timestamp), least recently used first
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self.store_lines = 0
+        if store is not None:
+            self._load()
+
+    def _expired(self, timestamp: float) -> bool:
+        return self.ttl is not None and self.clock() - timestamp > self.ttl
+
+    def _insert(self, key, verdict: bool, timestamp: float):
+        self.entries[key] = (verdict, timestamp)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self):
+        try:
+            with open(self.store) as f:
+                for line in f:
+                    self.store_lines += 1
+                    try:
+                        key, verdict, timestamp = line.split()
+                        timestamp = float(timestamp)
+                        if verdict not in ("0", "1"):
+                            raise ValueError(f"invalid verdict {verdict}")
+                    except ValueError:
+                        # E.g. the last line of a put() cut short by a crash, dropped by _compact() below
+                        continue
+                    if not self._expired(timestamp):
+                        self._insert(key, verdict == "1", timestamp)
+        except FileNotFoundError:
+            return
+        if self.store_lines > len(self.entries):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the store with the entries in memory that have not expired, least recently used first."""
+        live = [(key, entry) for key, entry in self.entries.items() if not self._expired(entry[1])]
+        tmp = f"{self.store}.tmp"
+        with open(tmp, "w") as f:
+            for key, (verdict, timestamp) in live:
+                f.write(f"{key} {int(verdict)} {timestamp}\n")
+        os.replace(tmp, self.store)
+        self.store_lines = len(live)
+
+    def get(self, key):
+        """The cached verdict of key, or None."""
+        key = str(key)
+        entry = self.entries.get(key)
+        if entry is not None and self._expired(entry[1]):
+            del self.entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, verdict: bool):
+        key = str(key)
+        timestamp = self.clock()
+        self._insert(key, verdict, timestamp)
+        if self.store is not None:
+            with open(self.store, "a") as f:
+                f.write(f"{key} {int(verdict)} {timestamp}\n")
+            self.store_lines += 1
+            if self.store_lines > 2 * self.maxsize:
+                self._compact()
+
+    def __call__(self, key, compute):
+        """The verdict of key, from the cache or else compute() (then cached)."""
+        verdict = self.get(key)
+        if verdict is None:
+            verdict = bool(compute())
+            self.put(key, verdict)
+        return verdict
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        """Forget the in-memory verdicts (the store is left alone) and reset the statistics."""
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @property
+    def stats(self) -> attrdict:
+        return attrdict(
+            hits=self.hits, misses=self.misses, evictions=self.evictions, expirations=self.expirations,
+            size=len(self.entries), maxsize=self.maxsize,
+        )
@@ -0,0 +1,71 @@
+"""Traditional Velu for every l up to the hybrid cutoff: xisog_t and one xeval_t per point against the fused xisog_eval_t.
+
+Both do the same Fp-operations; the fused kernel makes one pass over the kernel multiples instead of 1 + points.
+Latency and peak memory are measured on the uncounted field. Run from the repository root:
+
+    python -m benchmarks.bench_fused_velu --prime p1024_CTIDH p2048_CTIDH
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from CTIDH import MontgomeryCurve, MontgomeryIsogeny
+from CTIDH.utils import batchmaxprime_of_Li
+
+
+def separate(isogeny, d, d_fake, Xi_Zi_hats, A, Ts):
+    return isogeny.xisog_t(d, d_fake, Xi_Zi_hats, A), [isogeny.xeval_t(d, d_fake, Xi_Zi_hats, T) for T in Ts]
+
+
+def fused(isogeny, d, d_fake, Xi_Zi_hats, A, Ts):
+    return isogeny.xisog_eval_t(d, d_fake, Xi_Zi_hats, A, Ts)
+
+
+def peak_kib(f) -> float:
+    tracemalloc.start()
+    f()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def bench_fused_velu(prime_name, points, number):
+    curve = MontgomeryCurve(prime_name, False, "original", "gmpy2", False)
+    field = curve.field
+    isogeny = MontgomeryIsogeny("tvelu")(curve)
+    # The fixed cutoff, not the measured formulae of data/formulae/
+    cutoff = MontgomeryIsogeny("hvelu")(curve, measured=False).HYBRID_BOUND
+    # The formulae do not check that P has order l, the costs are the same for any P
+    A = (field(0), field(1))
+    P = (field.get_random(), field(1))
+    Ts = [(field.get_random(), field(1)) for _ in range(points)]
+
+    print(f"{prime_name}: xisog + {points} xeval, l <= {cutoff}, padded to the largest l of the batch")
+    print(f"{'l':>6}{'separate us':>14}{'fused us':>12}{'speedup':>10}{'separate KiB':>15}{'fused KiB':>12}")
+    totals = [0.0, 0.0]
+    for i, l in enumerate(curve.L):
+        if l > cutoff:
+            break
+        d = (l - 1) // 2
+        d_fake = (batchmaxprime_of_Li(i, curve.batch_start, curve.batch_stop, curve.L) - 1) // 2
+        Xi_Zi_hats = isogeny.hats(isogeny.kps_t(d_fake, P, curve.xA24(A)))
+        row = []
+        for kernel in (separate, fused):
+            call = lambda: kernel(isogeny, d, d_fake, Xi_Zi_hats, A, Ts)
+            row.append(min(timeit.repeat(call, number=number, repeat=3)) / number * 1e6)
+            row.append(peak_kib(call))
+        totals[0] += row[0]
+        totals[1] += row[2]
+        print(f"{l:>6}{row[0]:>14.1f}{row[2]:>12.1f}{row[0] / row[2]:>9.2f}x{row[1]:>15.1f}{row[3]:>12.1f}")
+    print(f"{'total':>6}{totals[0]:>14.1f}{totals[1]:>12.1f}{totals[0] / totals[1]:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prime", nargs="+", default=["p1024_CTIDH", "p2048_CTIDH"])
+    parser.add_argument("--points", type=int, default=2, help="points pushed through each isogeny")
+    parser.add_argument("--number", type=int, default=200, help="timing runs per l")
+    args = parser.parse_args()
+
+    for prime_name in args.prime:
+        bench_fused_velu(prime_name, args.points, args.number)
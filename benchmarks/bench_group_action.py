@@ -0,0 +1,71 @@
+"""Latency and peak memory of the curve kernels and of a full group action.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_group_action --backend gmpy2 --no-counting
+"""
+import argparse
+import time
+import timeit
+import tracemalloc
+
+from CTIDH.csidh import CSIDH
+
+
+def bench_kernels(curve, number):
+    field = curve.field
+    A24 = (field.get_random(), field.get_random())
+    P = (field.get_random(), field.get_random())
+    Q = (field.get_random(), field.get_random())
+    PQ = (field.get_random(), field.get_random())
+    kernels = {
+        "xdbl": lambda: curve.xdbl(P, A24),
+        "xadd": lambda: curve.xadd(P, Q, PQ),
+        "crisscross": lambda: curve.crisscross(P[0], P[1], Q[0], Q[1]),
+        "xmul_Ladder(983)": lambda: curve.xmul_Ladder(P, A24, curve.L.index(983)),
+    }
+    for name, kernel in kernels.items():
+        n = number if name != "xmul_Ladder(983)" else max(1, number // 40)
+        t = timeit.timeit(kernel, number=n) / n
+        print(f"{name:>18}: {t * 1e6:10.2f} us")
+
+
+def bench_by_function(csidh):
+    sk = csidh.skgen()
+    with csidh.field.counting(by_function=True) as c:
+        csidh.group_action(0, sk)
+    print(f"{'function':>18}  {'calls':>8} {'M':>10} {'S':>10} {'a':>10} {'P':>6} {'I':>6}")
+    for name, n in sorted(c.by_function.items(), key=lambda item: -item[1].M - item[1].S):
+        print(f"{name:>18}  {n.calls:8d} {n.M:10d} {n.S:10d} {n.a:10d} {n.P:6d} {n.I:6d}")
+    print(f"{'total':>18}  {'':>8} {c.M:10d} {c.S:10d} {c.a:10d} {c.P:6d} {c.I:6d}")
+
+
+def bench_group_action(csidh, runs):
+    sk = csidh.skgen()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(runs):
+        csidh.group_action(0, sk)
+    elapsed = (time.perf_counter() - start) / runs
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'group_action':>18}: {elapsed:10.3f} s, peak {peak / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prime", default="p1024_CTIDH")
+    parser.add_argument("--formula", default="tvelu")
+    parser.add_argument("--backend", default="gmpy2", choices=["sage", "gmpy2"])
+    parser.add_argument("--no-counting", dest="counting", action="store_false")
+    parser.add_argument("--number", type=int, default=20000, help="iterations per kernel")
+    parser.add_argument("--runs", type=int, default=1, help="group actions to average over")
+    parser.add_argument("--by-function", action="store_true", help="Fp-operation counts per function (needs counting)")
+    args = parser.parse_args()
+
+    csidh = CSIDH(args.prime, args.formula, verbose=False, backend=args.backend, counting=args.counting)
+    print(f"{args.prime}, backend={args.backend}, counting={args.counting}")
+    bench_kernels(csidh.curve, args.number)
+    bench_group_action(csidh, args.runs)
+    if args.by_function:
+        bench_by_function(csidh)
@@ -0,0 +1,37 @@
+"""Fermat (a ** (p-2)) against constant-time safegcd inversion for p1024_CTIDH and p2048_CTIDH.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_invert --backend gmpy2
+"""
+import argparse
+import timeit
+
+from CTIDH import PrimeField
+from CTIDH.utils import read_prime_info
+
+
+def bench_invert(field, number):
+    a = field.get_random()
+    for mode in ["fermat", "safegcd"]:
+        field.set_inversion(mode)
+        field.reset_runtime()
+        field.reset_power_invert_time()
+        ~a
+        cost = f"{field.mul_count}M + {field.sqr_count}S + {field.inv_count}I"
+        t = timeit.timeit(lambda: ~a, number=number) / number
+        steps = f" ({field.safegcd_steps} divsteps)" if mode == "safegcd" else ""
+        print(f"{mode:>8}: {t * 1e6:10.1f} us, {cost}{steps}")
+    field.set_inversion("fermat")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", default="gmpy2", choices=["sage", "gmpy2"])
+    parser.add_argument("--number", type=int, default=200, help="inversions per measurement")
+    args = parser.parse_args()
+
+    for prime_name in ["p1024_CTIDH", "p2048_CTIDH"]:
+        field = PrimeField(read_prime_info(prime_name)["p"], backend=args.backend)
+        print(f"{prime_name}, backend={args.backend}")
+        bench_invert(field, args.number)
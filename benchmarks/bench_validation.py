@@ -0,0 +1,53 @@
+"""Cost of public-key validation: issupersingular_original against doliskani, pairing1 and pairing2.
+
+The curves are A = 0 and the supersingular coefficients of tests/data/supersingular_coeff/<prime>.
+Run from the repository root:
+
+    python -m benchmarks.bench_validation --prime p1024_CTIDH p2048_CTIDH
+"""
+import argparse
+import time
+
+from CTIDH.mont import MontgomeryCurve
+
+VALIDATIONS = ["original", "doliskani", "pairing1", "pairing2"]
+
+
+def load_coefficients(prime_name, count):
+    try:
+        with open(f"tests/data/supersingular_coeff/{prime_name}") as f:
+            return [0] + [int(a) for a in f][:count]
+    except FileNotFoundError:
+        return [0]  # supersingular, as p = 3 mod 4
+
+
+def bench_validation(prime_name, count):
+    coefficients = load_coefficients(prime_name, count)
+    print(f"{prime_name}, mean over {len(coefficients)} supersingular curves")
+    for validation in VALIDATIONS:
+        # Operation counts on the counting field, latency on the uncounted one
+        curve = MontgomeryCurve(prime_name, False, validation, "gmpy2", True)
+        field = curve.field
+        with field.counting() as c:
+            for a in coefficients:
+                assert curve.issupersingular((field(a), field(1)))
+
+        curve = MontgomeryCurve(prime_name, False, validation, "gmpy2", False)
+        field = curve.field
+        start = time.perf_counter()
+        for a in coefficients:
+            assert curve.issupersingular((field(a), field(1)))
+        elapsed = (time.perf_counter() - start) / len(coefficients)
+
+        m, s, add = (x / len(coefficients) for x in (c.M, c.S, c.a))
+        print(f"{validation:>10}: {m:9.0f} M {s:9.0f} S {add:9.0f} a, {elapsed * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prime", nargs="+", default=["p1024_CTIDH", "p2048_CTIDH"])
+    parser.add_argument("--count", type=int, default=9, help="coefficients read from tests/data")
+    args = parser.parse_args()
+
+    for prime_name in args.prime:
+        bench_validation(prime_name, args.count)
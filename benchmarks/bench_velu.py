@@ -0,0 +1,60 @@
+"""Fp-operations of one l-isogeny (kps, xisog and one xeval): traditional Velu against velusqrt.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_velu --prime p1024_CTIDH p2048_CTIDH
+"""
+import argparse
+
+from CTIDH import MontgomeryCurve, MontgomeryIsogeny
+
+
+def velu_isogeny(isogeny, i, A, P, T):
+    """kps, xisog and one xeval of the L[i]-isogeny with kernel <P>, with the unpadded sizes of L[i]."""
+    curve = isogeny.curve
+    l = curve.L[i]
+    if isogeny.formula_name == "tvelu":
+        d = (l - 1) // 2
+        Xi_Zi_hats = isogeny.hats(isogeny.kps_t(d, P, curve.xA24(A)))
+        isogeny.xisog_t(d, d, Xi_Zi_hats, A)
+        isogeny.xeval_t(d, d, Xi_Zi_hats, T)
+    else:
+        isogeny.set_parameters_velu(isogeny.sJ_list[i], isogeny.sI_list[i], i)
+        isogeny.kps_s(P, curve.xA24(A), i)
+        isogeny.xisog_s(A, i)
+        isogeny.xeval_s(T, A)
+
+
+def velu_cost(isogeny, i, A, P, T) -> int:
+    with isogeny.field.counting() as c:
+        velu_isogeny(isogeny, i, A, P, T)
+    return c.M + c.S
+
+
+def bench_velu(prime_name, step):
+    curve = MontgomeryCurve(prime_name, False, "original", "gmpy2", True)
+    field = curve.field
+    isogenies = {
+        "tvelu": MontgomeryIsogeny("tvelu")(curve),
+        "svelu": MontgomeryIsogeny("svelu")(curve, True, False),
+        "svelu scaled": MontgomeryIsogeny("svelu")(curve, True, True),
+    }
+    # The formulae do not check that P has order l, the counts are the same for any P
+    A = (field(0), field(1))
+    P, T = (field.get_random(), field(1)), (field.get_random(), field(1))
+
+    print(f"{prime_name}: M+S of kps + xisog + xeval")
+    print(f"{'l':>6}" + "".join(f"{name:>14}" for name in isogenies))
+    for i in range(0, curve.n, step):
+        row = [velu_cost(isogeny, i, A, P, T) for isogeny in isogenies.values()]
+        print(f"{curve.L[i]:>6}" + "".join(f"{x:>14}" for x in row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prime", nargs="+", default=["p1024_CTIDH", "p2048_CTIDH"])
+    parser.add_argument("--step", type=int, default=8, help="print every step-th l")
+    args = parser.parse_args()
+
+    for prime_name in args.prime:
+        bench_velu(prime_name, args.step)
@@ -0,0 +1,64 @@
+"""xdbl/xadd counts of [l]P for every l: Montgomery ladder against SDACs and PRAC.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_xmul --prime p1024_CTIDH p2048_CTIDH
+"""
+import argparse
+import timeit
+
+from CTIDH.mont import MontgomeryCurve
+
+XMULS = ["Ladder", "SDAC", "SDAC_safe", "PRAC"]
+
+
+def kernel_calls(curve, xmul, P, A24, j) -> tuple:
+    with curve.field.counting(by_function=True) as c:
+        xmul(P, A24, j)
+    calls = lambda name: c.by_function[name].calls if name in c.by_function else 0
+    return calls("xdbl"), calls("xadd"), c.M + c.S
+
+
+def bench_xmul(prime_name, verbose, number):
+    curve = MontgomeryCurve(prime_name, True, "original", "gmpy2", True)
+    field = curve.field
+    A24 = (field(2), field(4))  # A = 0
+    P = (field.get_random(), field(1))
+    xmuls = {name: curve[f"xmul_{name}"] for name in XMULS}
+
+    print(f"{prime_name}: xdbl/xadd per [l]P")
+    if verbose:
+        print(f"{'l':>6}" + "".join(f"{name:>14}" for name in xmuls))
+    totals = {name: [0, 0, 0] for name in xmuls}
+    for j, l in enumerate(curve.L):
+        row = {name: kernel_calls(curve, xmul, P, A24, j) for name, xmul in xmuls.items()}
+        for name, counts in row.items():
+            totals[name] = [x + y for x, y in zip(totals[name], counts)]
+        if verbose:
+            print(f"{l:>6}" + "".join(f"{f'{d}/{a}':>14}" for d, a, _ in row.values()))
+
+    ladder_ms = totals["Ladder"][2]
+    for name, (d, a, ms) in totals.items():
+        print(f"{name:>10}: {d:6d} xdbl {a:6d} xadd {ms:8d} M+S ({100 * (ms - ladder_ms) / ladder_ms:+.1f}%)")
+
+    if number:
+        # Latency on the uncounted field
+        curve = MontgomeryCurve(prime_name, True, "original", "gmpy2", False)
+        field = curve.field
+        A24 = (field(2), field(4))
+        P = (field.get_random(), field(1))
+        for name in XMULS:
+            xmul = curve[f"xmul_{name}"]
+            t = timeit.timeit(lambda: [xmul(P, A24, j) for j in range(len(curve.L))], number=number) / number
+            print(f"{name:>10}: {t * 1e3:8.2f} ms for all l")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prime", nargs="+", default=["p1024_CTIDH", "p2048_CTIDH"])
+    parser.add_argument("--verbose", action="store_true", help="one row per l")
+    parser.add_argument("--number", type=int, default=3, help="timing runs over all l, 0 to skip")
+    args = parser.parse_args()
+
+    for prime_name in args.prime:
+        bench_xmul(prime_name, args.verbose, args.number)
@@ -0,0 +1,97 @@
+"""Measure traditional Velu against velusqrt for every l and write the formula table used by 'hvelu'.
+
+For each l, kps + xisog + one xeval is run with both formulae: the Fp-operations (M+S) on a counting field and the
+latency (median of --repeat runs) on the field backend itself. A single crossover is then fitted, the one minimizing
+the total cost (--metric) of tvelu below it and svelu from it on, so that timing noise near the crossover does not
+flip the formula back and forth. The formula of each l goes to data/formulae/<prime>_<scaled|unscaled>_<backend>, from which MontgomeryIsogeny('hvelu') takes the
+formula of every batch, that of its largest prime. Run from the repository root:
+
+    python -m benchmarks.tune_velu --prime p1024_CTIDH p2048_CTIDH --backend gmpy2
+"""
+import argparse
+import os
+import statistics
+import timeit
+
+from CTIDH import MontgomeryCurve, MontgomeryIsogeny
+from CTIDH.utils import velu_formulae_path
+
+from benchmarks.bench_velu import velu_cost, velu_isogeny
+
+FORMULAE = ["tvelu", "svelu"]
+
+
+def velu_latency(isogeny, i, A, P, T, number, repeat) -> float:
+    """Microseconds of velu_isogeny(), the median of repeat runs."""
+    runs = timeit.repeat(lambda: velu_isogeny(isogeny, i, A, P, T), number=number, repeat=repeat)
+    return statistics.median(runs) / number * 1e6
+
+
+def crossover(tvelu_costs, svelu_costs) -> int:
+    """The index c minimizing sum(tvelu_costs[:c]) + sum(svelu_costs[c:]), the smallest one on ties."""
+    total = sum(svelu_costs)
+    best, best_total = 0, total
+    for c, (tvelu_cost, svelu_cost) in enumerate(zip(tvelu_costs, svelu_costs), 1):
+        total += tvelu_cost - svelu_cost
+        if total < best_total:
+            best, best_total = c, total
+    return best
+
+
+def tune_velu(prime_name, backend, scaled, metric, number, repeat=5):
+    """Rows (l, formula, tvelu_ops, svelu_ops, tvelu_us, svelu_us) for every l of the prime, see crossover()."""
+    def isogenies(counting):
+        curve = MontgomeryCurve(prime_name, False, "original", backend, counting)
+        return [MontgomeryIsogeny(name)(curve, True, scaled) for name in FORMULAE]
+
+    counted = isogenies(True)
+    # Only the gmpy2 backend can switch the counting off
+    timed = isogenies(False) if backend == "gmpy2" else counted
+
+    measures = []
+    for i, l in enumerate(counted[0].L):
+        ops, latency = [], []
+        for counted_isogeny, timed_isogeny in zip(counted, timed):
+            field = counted_isogeny.field
+            # The formulae do not check that P has order l, the costs are the same for any P
+            A, P, T = (field(0), field(1)), (field.get_random(), field(1)), (field.get_random(), field(1))
+            ops.append(velu_cost(counted_isogeny, i, A, P, T))
+            field = timed_isogeny.field
+            A, P, T = (field(0), field(1)), (field.get_random(), field(1)), (field.get_random(), field(1))
+            latency.append(velu_latency(timed_isogeny, i, A, P, T, number, repeat))
+        measures.append((l, *ops, *latency))
+
+    column = 3 if metric == "time" else 1
+    c = crossover([m[column] for m in measures], [m[column + 1] for m in measures])
+    return [(l, FORMULAE[i >= c], *costs) for i, (l, *costs) in enumerate(measures)]
+
+
+def write_table(path, rows, metric):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(f"# l formula tvelu_ops svelu_ops tvelu_us svelu_us (crossover by {metric}, benchmarks/tune_velu.py)\n")
+        for l, formula, tvelu_ops, svelu_ops, tvelu_us, svelu_us in rows:
+            f.write(f"{l} {formula} {tvelu_ops} {svelu_ops} {tvelu_us:.1f} {svelu_us:.1f}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prime", nargs="+", default=["p1024_CTIDH", "p2048_CTIDH"])
+    parser.add_argument("--backend", choices=["sage", "gmpy2"], default="gmpy2")
+    parser.add_argument("--scaled", action="store_true", help="velusqrt with scaled remainder trees")
+    parser.add_argument("--metric", choices=["time", "ops"], default="time", help="latency or M+S")
+    parser.add_argument("--number", type=int, default=10, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per l and formula, the median is kept")
+    parser.add_argument("--dry-run", action="store_true", help="print the table without writing it")
+    args = parser.parse_args()
+
+    for prime_name in args.prime:
+        rows = tune_velu(prime_name, args.backend, args.scaled, args.metric, args.number, args.repeat)
+        print(f"{prime_name} ({args.backend}, {'scaled' if args.scaled else 'unscaled'}), crossover by {args.metric}")
+        print(f"{'l':>6}{'formula':>8}{'tvelu M+S':>11}{'svelu M+S':>11}{'tvelu us':>11}{'svelu us':>11}")
+        for l, formula, tvelu_ops, svelu_ops, tvelu_us, svelu_us in rows:
+            print(f"{l:>6}{formula:>8}{tvelu_ops:>11}{svelu_ops:>11}{tvelu_us:>11.1f}{svelu_us:>11.1f}")
+        if not args.dry_run:
+            path = velu_formulae_path(prime_name, args.scaled, args.backend)
+            write_table(path, rows, args.metric)
+            print(f"written to {path}")
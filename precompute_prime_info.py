@@ -6,6 +6,8 @@ from Crypto.Util.number import sieve_base
 
 from sage.all import product
 
+from CTIDH.utils import exponent_chains
+
 # @cache
 def gen_prime_info(n, k, excluded=[], included=[]):
     """Return a dict like
@@ -69,4 +71,13 @@ def write_primes_to_file(primes:dict):
         with open(f'data/prime_info/{prime_name}', 'w') as f:
             json.dump(primes[prime_name], f)
 
-write_primes_to_file(primes=primes)
\ No newline at end of file
+write_primes_to_file(primes=primes)
+
+
+# Addition chains of the fixed exponents p-2, (p-1)/2, (p+1)/4, used by PrimeField()
+def write_exponent_chains_to_file(primes:dict):
+    for prime_name in primes.keys():
+        with open(f'data/chains/{prime_name}', 'w') as f:
+            json.dump(exponent_chains(primes[prime_name]['p']), f)
+
+write_exponent_chains_to_file(primes=primes)
@@ -1,8 +1,11 @@
+import os
+import tempfile
 import unittest
 
 import numpy as np
 
 from CTIDH.csidh import CSIDH
+from CTIDH.utils import VerdictCache
 
 class TestCSIDH(unittest.TestCase):
     """Showcase for a test with setUp and tearDown methods"""
@@ -93,9 +96,110 @@ class TestCSIDH(unittest.TestCase):
             test_one_CSIDH_instance(instance)
 
 
+    def test_derive_many(self, num_pks=3):
+        for instance in self.CSIDH_instances:
+            sk = instance.skgen()
+            sks, pks = zip(*[instance.keygen() for _ in range(num_pks)])
+            shared = instance.derive_many(sk, list(pks))
+            pk = instance.group_action(0, sk)
+            for i in range(num_pks):
+                self.assertEqual(shared[i], instance.derive(sks[i], pk))
+
+    def test_verdict_cache(self):
+        instance = CSIDH('p1024_CTIDH', 'tvelu', verdict_cache=4, backend='gmpy2')
+        _, pk = instance.keygen()
+        for _ in range(3):
+            self.assertTrue(instance.is_supersingular(pk))
+        self.assertEqual((instance.verdict_cache.stats.misses, instance.verdict_cache.stats.hits), (1, 2))
+        with instance.field.counting() as c:
+            instance.is_supersingular(pk)
+        self.assertEqual(c.M + c.S, 0)
+
+        # A store shared by two validation modes: each one validates the key itself
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, "verdicts")
+            for validation in ["original", "doliskani"]:
+                instance = CSIDH('p1024_CTIDH', 'tvelu', validation=validation, verdict_cache=4, verdict_store=store, backend='gmpy2')
+                self.assertTrue(instance.is_supersingular(pk))
+                self.assertEqual((instance.verdict_cache.stats.misses, instance.verdict_cache.stats.hits), (1, 0))
+
+
     def tearDown(self) -> None:
         for ins in self.CSIDH_instances:
             del ins
         # del self.CSIDH_instances
 
-        return super().tearDown()
\ No newline at end of file
+        return super().tearDown()
+
+class TestVerdictCache(unittest.TestCase):
+    def test_lru(self):
+        cache = VerdictCache(2)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", True)
+        cache.put("b", False)
+        self.assertTrue(cache.get("a"))
+        cache.put("c", True)  # evicts b, the least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertFalse(cache("b", lambda: False))
+        self.assertEqual(cache("b", lambda: self.fail("cached")), False)
+        self.assertEqual(len(cache), 2)
+        stats = cache.stats
+        self.assertEqual((stats.hits, stats.misses, stats.evictions), (2, 3, 2))
+        self.assertRaises(ValueError, VerdictCache, 0)
+
+    def test_ttl(self):
+        now = [0.0]
+        cache = VerdictCache(8, ttl=10, clock=lambda: now[0])
+        cache.put("a", True)
+        now[0] = 10
+        self.assertTrue(cache.get("a"))
+        now[0] = 10.5
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats.expirations, 1)
+
+    def test_store(self):
+        now = [0.0]
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, "verdicts")
+            cache = VerdictCache(8, ttl=10, store=store, clock=lambda: now[0])
+            cache.put("a", True)
+            cache.put("b", False)
+            now[0] = 5
+            cache.put("c", True)
+
+            cache = VerdictCache(8, ttl=10, store=store, clock=lambda: now[0])
+            self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (True, False, True))
+            now[0] = 12
+            cache = VerdictCache(8, ttl=10, store=store, clock=lambda: now[0])
+            self.assertEqual((cache.get("a"), cache.get("c")), (None, True))
+
+            # Only the live entry c is left in the store after loading it
+            with open(store) as f:
+                self.assertEqual([line.split()[0] for line in f], ["c"])
+
+    def test_store_truncated_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, "verdicts")
+            cache = VerdictCache(8, store=store)
+            cache.put("a", True)
+            cache.put("b", False)
+            # A put() cut short by a crash
+            with open(store, "a") as f:
+                f.write("c 1")
+
+            cache = VerdictCache(8, store=store)
+            self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (True, False, None))
+            # The truncated line is dropped from the store
+            with open(store) as f:
+                self.assertEqual([line.split()[0] for line in f], ["a", "b"])
+
+    def test_store_compaction(self, maxsize=4):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, "verdicts")
+            cache = VerdictCache(maxsize, store=store)
+            for i in range(10 * maxsize):
+                cache.put(str(i % (maxsize + 1)), i % 2 == 0)
+                with open(store) as f:
+                    self.assertLessEqual(len(f.readlines()), 2 * maxsize)
+            # The store holds the cached verdicts, the last one put of each key
+            self.assertEqual(dict(VerdictCache(maxsize, store=store).entries), dict(cache.entries))
@@ -26,7 +26,11 @@ MontCurve_p2048 = MontgomeryCurve("p2048_CTIDH")
 isogeny_tvelu_p1024 = MontgomeryIsogeny("tvelu")(MontCurve_p1024)
 isogeny_tvelu_p2048 = MontgomeryIsogeny("tvelu")(MontCurve_p2048)
 
-# NOTE: To test velusqrt, Add hvelu in the future. Maybe also add svelu.
+isogeny_svelu_p1024 = MontgomeryIsogeny("svelu")(MontCurve_p1024)
+isogeny_svelu_p1024_scaled = MontgomeryIsogeny("svelu")(MontCurve_p1024, scaled=True)
+isogeny_svelu_p2048 = MontgomeryIsogeny("svelu")(MontCurve_p2048)
+isogeny_hvelu_p1024 = MontgomeryIsogeny("hvelu")(MontCurve_p1024)
+isogeny_hvelu_p1024_scaled = MontgomeryIsogeny("hvelu")(MontCurve_p1024, scaled=True)
 
 
 def get_sage_montgomery_curve(sage_Fp, a: int):
@@ -421,17 +425,171 @@ class TestMontgomeryIsogeny(unittest.TestCase):
                 a_new = test_one_curve(field(a_new))
     
 
+    def random_kernel_point(self, MontCurve, A, ind):
+        """A point of order L[ind] on E_A, and another random point."""
+        A24 = MontCurve.xA24(A)
+        while True:
+            T, T_minus = MontCurve.elligator(A)
+            P = MontCurve.xdbl(T, A24)
+            P = MontCurve.xdbl(P, A24)  # clear cofactor
+            P = MontCurve.xmul_public_product(P, A24, [j for j in range(MontCurve.n) if j != ind])
+            if not MontCurve.isinfinity(P):
+                return P, T_minus
+
     def test_kps_s(self, num_curve=5, num_isogeny=3):
-        pass
+        field, sage_Fp, MontCurve, MontIsogeny = Fp1024, GF(p1024), MontCurve_p1024, isogeny_svelu_p1024
+        for _ in range(num_curve):
+            a = field(0)
+            sage_EC = get_sage_montgomery_curve(sage_Fp, 0)
+            for _ in range(num_isogeny):
+                ind = get_randint(0, MontCurve.n - 1)
+                A = (a, field(1))
+                P, _ = self.random_kernel_point(MontCurve, A, ind)
+                MontIsogeny.set_parameters_velu(MontIsogeny.sJ_list[ind], MontIsogeny.sI_list[ind], ind)
+                MontIsogeny.kps_s(P, MontCurve.xA24(A), ind)
+                b, c, sK = MontIsogeny.sJ, MontIsogeny.sI, MontIsogeny.sK
+                self.assertEqual(4 * b * c + 2 * sK, MontCurve.L[ind] - 1)
+
+                sage_P = sage_EC.lift_x(sage_Fp(get_affine_from_projective(P)))
+                multiples = [2 * j + 1 for j in range(b)] + [2 * b * (2 * i + 1) for i in range(c)]
+                multiples += [4 * b * c + 2 * k + 1 for k in range(sK)]
+                for k, Q in zip(multiples, MontIsogeny.J + MontIsogeny.I + MontIsogeny.K):
+                    self.assertEqual(get_affine_from_projective(Q), (k * sage_P).xy()[0])
+
+    def check_velusqrt(self, MontIsogeny, num_curve, num_isogeny, min_ind=0):
+        """xisog_s and xeval_s must agree with xisog_t and xeval_t (tested against Sage in test_tvelu)."""
+        field, MontCurve = MontIsogeny.field, MontIsogeny.curve
+        MontIsogeny_t = {MontCurve_p1024: isogeny_tvelu_p1024, MontCurve_p2048: isogeny_tvelu_p2048}[MontCurve]
+        a = field(0)
+        for _ in range(num_curve):
+            A = (a, field(1))
+            for _ in range(num_isogeny):
+                ind = get_randint(min_ind, MontCurve.n - 1)
+                l = MontCurve.L[ind]
+                d = (l - 1) // 2
+                P, T = self.random_kernel_point(MontCurve, A, ind)
+
+                Xi_Zi_hats = MontIsogeny_t.hats(MontIsogeny_t.kps_t(d, P, MontCurve.xA24(A)))
+                A_new = MontIsogeny_t.xisog_t(d, d, Xi_Zi_hats, A)
+                phi_T = MontIsogeny_t.xeval_t(d, d, Xi_Zi_hats, T)
+
+                MontIsogeny.set_parameters_velu(MontIsogeny.sJ_list[ind], MontIsogeny.sI_list[ind], ind)
+                MontIsogeny.kps_s(P, MontCurve.xA24(A), ind)
+                self.assertEqual(get_affine_from_projective(MontIsogeny.xisog_s(A, ind)), get_affine_from_projective(A_new))
+                self.assertEqual(get_affine_from_projective(MontIsogeny.xeval_s(T, A)), get_affine_from_projective(phi_T))
+            a = field(get_affine_from_projective(A_new))
 
     def test_xisog_s(self, num_curve=5, num_isogeny=3):
-        pass
+        self.check_velusqrt(isogeny_svelu_p1024, num_curve, num_isogeny)
 
-    def test_xeval_s(self, num_curve=5, num_isogeny=3):
-        pass
+    def test_xeval_s(self, num_curve=2, num_isogeny=3):
+        # Large l only
+        self.check_velusqrt(isogeny_svelu_p2048, num_curve, num_isogeny, min_ind=150)
 
     def test_svelu(self, num_curve=5, num_isogeny=3):
-        pass
+        # The scaled remainder trees
+        self.check_velusqrt(isogeny_svelu_p1024_scaled, num_curve, num_isogeny)
+
+    def test_matryoshka_isogeny_svelu(self, num_curve=2, num_batch=2):
+        field, MontCurve = Fp1024, MontCurve_p1024
+        batch_start, batch_stop, L = MontCurve.batch_start, MontCurve.batch_stop, MontCurve.L
+        for MontIsogeny in [isogeny_hvelu_p1024, isogeny_hvelu_p1024_scaled]:
+            a = field(0)
+            for _ in range(num_curve):
+                A = (a, field(1))
+                for _ in range(num_batch):
+                    # A batch above the cutoff, whose every prime must cost exactly the same
+                    b = get_randint(len(batch_start) // 2, len(batch_start) - 1)
+                    counts = []
+                    for ind in range(batch_start[b], batch_stop[b]):
+                        l = L[ind]
+                        d = (l - 1) // 2
+                        P, T = self.random_kernel_point(MontCurve, A, ind)
+                        T0, T1 = MontCurve.elligator(A)
+
+                        Xi_Zi_hats = isogeny_tvelu_p1024.hats(isogeny_tvelu_p1024.kps_t(d, P, MontCurve.xA24(A)))
+                        A_new = isogeny_tvelu_p1024.xisog_t(d, d, Xi_Zi_hats, A)
+                        phi_T0 = isogeny_tvelu_p1024.xeval_t(d, d, Xi_Zi_hats, T0)
+                        phi_T1 = isogeny_tvelu_p1024.xeval_t(d, d, Xi_Zi_hats, T1)
 
-    def test_matryoshka_isogeny_svelu(self, num_curve=5, num_isogeny=3):
-        pass
+                        field.reset_runtime()
+                        field.reset_power_invert_time()
+                        Anew, Ts_new = MontIsogeny.matryoshka_isogeny(A, [T0, T1], 2, P, ind)
+                        counts.append((field.mul_count, field.sqr_count, field.add_count, field.pow_count, field.inv_count))
+
+                        self.assertEqual(get_affine_from_projective(Anew), get_affine_from_projective(A_new))
+                        self.assertEqual(get_affine_from_projective(Ts_new[0]), get_affine_from_projective(phi_T0))
+                        self.assertEqual(get_affine_from_projective(Ts_new[1]), get_affine_from_projective(phi_T1))
+                    self.assertEqual(counts, counts[:1] * len(counts))
+                a = field(get_affine_from_projective(A_new))
+
+    def test_kps_eval_many(self, num_isogeny=3, num_points=3):
+        field, MontCurve = Fp1024, MontCurve_p1024
+        A = (field(0), field(1))
+        A24 = MontCurve.xA24(A)
+        for MontIsogeny in [isogeny_tvelu_p1024, isogeny_hvelu_p1024, isogeny_svelu_p1024_scaled]:
+            for _ in range(num_isogeny):
+                ind = get_randint(0, MontCurve.n - 1)
+                l = MontCurve.L[ind]
+                d = (l - 1) // 2
+                P, _ = self.random_kernel_point(MontCurve, A, ind)
+                Ts = [MontCurve.elligator(A)[0] for _ in range(num_points)]
+
+                Xi_Zi_hats = isogeny_tvelu_p1024.hats(isogeny_tvelu_p1024.kps_t(d, P, A24))
+                A_new = isogeny_tvelu_p1024.xisog_t(d, d, Xi_Zi_hats, A)
+                phi_Ts = [isogeny_tvelu_p1024.xeval_t(d, d, Xi_Zi_hats, T) for T in Ts]
+
+                kps = MontIsogeny.kps(P, A, ind)
+                field.reset_runtime()
+                images = kps.eval_many(Ts)
+                eval_many_count = field.mul_count + field.sqr_count
+                self.assertEqual(get_affine_from_projective(kps.codomain), get_affine_from_projective(A_new))
+                self.assertEqual([get_affine_from_projective(T) for T in images], [get_affine_from_projective(T) for T in phi_Ts])
+                self.assertEqual(get_affine_from_projective(kps.eval(Ts[0])), get_affine_from_projective(phi_Ts[0]))
+                self.assertEqual(kps.eval_many([]), [])
+
+                # Every point costs the same, the kernel precomputation is not redone
+                field.reset_runtime()
+                kps.eval(Ts[0])
+                self.assertEqual(eval_many_count, num_points * (field.mul_count + field.sqr_count))
+
+    def test_xisog_eval_t(self, num_isogeny=5):
+        field, MontCurve, MontIsogeny = Fp1024, MontCurve_p1024, isogeny_tvelu_p1024
+        A = (field(0), field(1))
+        A24 = MontCurve.xA24(A)
+        for _ in range(num_isogeny):
+            ind = get_randint(0, MontCurve.n - 1)
+            l = MontCurve.L[ind]
+            d = (l - 1) // 2
+            d_fake = (batchmaxprime_of_Li(ind, MontCurve.batch_start, MontCurve.batch_stop, MontCurve.L) - 1) // 2
+            P, T = self.random_kernel_point(MontCurve, A, ind)
+            Xi_Zi_hats = MontIsogeny.hats(MontIsogeny.kps_t(d_fake, P, A24))
+            for Ts in [[], [T], [T, MontCurve.elligator(A)[0]]]:
+                field.reset_runtime()
+                A_new = MontIsogeny.xisog_t(d, d_fake, Xi_Zi_hats, A)
+                phi_Ts = [MontIsogeny.xeval_t(d, d_fake, Xi_Zi_hats, T) for T in Ts]
+                counts = (field.mul_count, field.sqr_count, field.add_count)
+
+                field.reset_runtime()
+                A_fused, phi_Ts_fused = MontIsogeny.xisog_eval_t(d, d_fake, Xi_Zi_hats, A, Ts)
+                self.assertEqual((field.mul_count, field.sqr_count, field.add_count), counts)
+                self.assertEqual(get_affine_from_projective(A_fused), get_affine_from_projective(A_new))
+                self.assertEqual([get_affine_from_projective(T) for T in phi_Ts_fused], [get_affine_from_projective(T) for T in phi_Ts])
+
+    def test_batch_formulae(self):
+        MontCurve = MontgomeryCurve("p1024_CTIDH", backend="gmpy2")
+        batch_max = [MontCurve.L[stop - 1] for stop in MontCurve.batch_stop]
+        measured = MontgomeryIsogeny("hvelu")(MontCurve)
+        cutoff = MontgomeryIsogeny("hvelu")(MontCurve, measured=False)
+        self.assertIsNone(cutoff.velu_formulae)
+        self.assertEqual(cutoff.batch_formulae, ['tvelu' if l <= cutoff.HYBRID_BOUND else 'svelu' for l in batch_max])
+        self.assertEqual(MontgomeryIsogeny("tvelu")(MontCurve).batch_formulae, ['tvelu'] * len(batch_max))
+        self.assertEqual(MontgomeryIsogeny("svelu")(MontCurve).batch_formulae, ['svelu'] * len(batch_max))
+        # data/formulae/p1024_CTIDH_unscaled_gmpy2, written by benchmarks/tune_velu.py
+        self.assertEqual(set(measured.velu_formulae), set(MontCurve.L))
+        self.assertEqual(measured.batch_formulae, [measured.velu_formulae[l] for l in batch_max])
+        # The description is that of the formulae in use
+        self.assertIn("with cutoff", repr(cutoff))
+        self.assertIn("ell <= 83", repr(cutoff))
+        self.assertIn("data/formulae/p1024_CTIDH_unscaled_gmpy2", repr(measured))
+        self.assertIn(f"ell <= {measured.HYBRID_BOUND}", repr(measured))
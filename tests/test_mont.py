@@ -1,5 +1,6 @@
 import unittest
 import json
+from math import prod
 
 import tqdm
 from sage.all import EllipticCurve, proof, GF, kronecker_symbol
@@ -70,8 +71,8 @@ class TestMontgomeryCurve(unittest.TestCase):
             def test_one_curve(a=field(0), num_point=num_point):
                 A = (a, field(1))
 
-                for _ in range(num_point):
-                    T0, T1 = MontCurve.elligator(A)
+                for i in range(num_point):
+                    T0, T1 = MontCurve.elligator(A, fast_legendre=(i % 2 == 0))
                     T0_x = get_affine_from_projective(T0)
                     self.assertEqual(
                         kronecker_symbol(T0_x**3+a.get_int_value()*T0_x**2+T0_x, p), 1
@@ -95,6 +96,21 @@ class TestMontgomeryCurve(unittest.TestCase):
             #     label="{} {} elligators".format(prime_name, num_curve * num_point)
             # )
 
+    def test_elligator_many(self, num_curve=10, num_point=8):
+        for p, field, MontCurve in [(p1024, Fp1024, MontCurve_p1024), (p2048, Fp2048, MontCurve_p2048)]:
+            for c in range(num_curve):
+                a = field(0) if c == 0 else field.get_random()
+                if a == 2 or a == -2:
+                    continue
+                u = field.get_random()
+                pairs = MontCurve.elligator_many((a * u, u), num_point) + [MontCurve.elligator_table((a * u, u))]
+                for T0, T1 in pairs:
+                    for T, symbol in [(T0, 1), (T1, -1)]:
+                        x = get_affine_from_projective(T)
+                        self.assertEqual(kronecker_symbol(x**3 + a.get_int_value() * x**2 + x, p), symbol)
+                self.assertEqual(len({get_affine_from_projective(T0) for T0, _ in pairs[:-1]}), num_point)
+            self.assertRaises(ValueError, MontCurve.elligator_many, (field(0), field(1)), 0)
+
     # TODO: Check the case when Az is not 1
     def test_xdbl(self, num_curve=20, num_point=5):
         for field, sage_Fp, MontCurve, prime_name in [
@@ -209,6 +225,155 @@ class TestMontgomeryCurve(unittest.TestCase):
             # )
 
 
+    def test_xmul_SDAC(self, num_curve=5):
+        for field, sage_Fp, prime_name, L in [
+            (Fp1024, sage_GFp1024, "p1024_CTIDH", p1024_info["L"]),
+            (Fp2048, sage_GFp2048, "p2048_CTIDH", p2048_info["L"]),
+        ]:
+            MontCurve = MontgomeryCurve(prime_name, SDAC=True)
+            self.assertIs(MontCurve.xmul_public, MontCurve.xmul_SDAC)
+            self.assertIs(MontCurve.xmul_private, MontCurve.xmul_SDAC_safe)
+
+            for c in range(num_curve):
+                a = field(0) if c == 0 else field.get_random()
+                A = (a, field(1))
+                sage_EC = get_sage_montgomery_curve(sage_Fp, a.get_int_value())
+                A24 = (A[0] + 2 * A[1], 4 * A[1])
+                P, _ = MontCurve.elligator(A)
+                sage_P = sage_EC.lift_x(sage_Fp(get_affine_from_projective(P)))
+
+                for i in range(len(L)):
+                    sage_Q = L[i] * sage_P
+                    for xmul in [MontCurve.xmul_SDAC, MontCurve.xmul_SDAC_safe]:
+                        Q = xmul(P, A24, i)
+                        self.assertEqual(get_affine_from_projective(Q), sage_Q[0])
+
+            # The private one costs the same for every l of a batch
+            P, A24 = (field.get_random(), field(1)), (field(2), field(4))
+            for start, stop in zip(MontCurve.batch_start, MontCurve.batch_stop):
+                costs = set()
+                for i in range(start, stop):
+                    with field.counting() as cnt:
+                        MontCurve.xmul_SDAC_safe(P, A24, i)
+                    costs.add((cnt.M, cnt.S, cnt.a))
+                self.assertEqual(len(costs), 1)
+
+            # A point of order 3, whose chains run into the point at infinity
+            sage_EC = get_sage_montgomery_curve(sage_Fp, 0)
+            sage_P = sage_EC.random_point() * (sage_EC.order() // 3)
+            if sage_P.is_zero():
+                continue
+            P = (field(int(sage_P[0])), field(1))
+            A24 = (field(2), field(4))
+            for i in range(1, len(L)):
+                for xmul in [MontCurve.xmul_SDAC, MontCurve.xmul_SDAC_safe]:
+                    Q = xmul(P, A24, i)
+                    self.assertEqual(get_affine_from_projective(Q), (L[i] * sage_P)[0])
+
+    def test_xmul_PRAC(self, num_point=3):
+        for field, prime_name, L in [(Fp1024, "p1024_CTIDH", p1024_info["L"]), (Fp2048, "p2048_CTIDH", p2048_info["L"])]:
+            MontCurve = MontgomeryCurve(prime_name, PRAC=True)
+            self.assertIs(MontCurve.xmul_public, MontCurve.xmul_PRAC)
+            self.assertIs(MontCurve.xmul_private, MontCurve.xmul_Ladder)
+
+            for _ in range(num_point):
+                a = field.get_random()
+                A24 = (a + 2, field(4))
+                P = (field.get_random(), field(1))
+                ladder_cost = prac_cost = 0
+                for i in range(len(L)):
+                    with field.counting() as cnt:
+                        Q = MontCurve.xmul_Ladder(P, A24, i)
+                    ladder_cost += cnt.M + cnt.S
+                    with field.counting() as cnt:
+                        R = MontCurve.xmul_PRAC(P, A24, i)
+                    prac_cost += cnt.M + cnt.S
+                    self.assertTrue(MontCurve.isequal(Q, R))
+                    # Every step of the chain is one xdbl or one xadd
+                    chain = MontCurve.PRAC_CHAINS[i]
+                    self.assertEqual((cnt.M, cnt.S), (4 * len(chain), 2 * len(chain)))
+                    self.assertEqual((cnt.M, cnt.S, cnt.a), tuple(MontCurve.cprac(i)))
+                # PRAC is no worse than the SDACs, which beat the ladder
+                self.assertLess(prac_cost, ladder_cost)
+                self.assertLessEqual(prac_cost, sum(MontCurve.measure(c) for c in MontCurve.c_xmul))
+
+    def test_xmul_public_product(self, num_point=3):
+        for field, MontCurve, info in [
+            (Fp1024, MontCurve_p1024, p1024_info),
+            (Fp1024, MontgomeryCurve("p1024_CTIDH", SDAC=True), p1024_info),
+            (Fp2048, MontgomeryCurve("p2048_CTIDH", SDAC=True, PRAC=True), p2048_info),
+        ]:
+            A24 = (field(2), field(4))
+            for _ in range(num_point):
+                P = (field.get_random(), field(1))
+                skipped = {get_randint(0, len(info["batch_start"]) - 1) for _ in range(3)}
+                indices = [
+                    j
+                    for i, (start, stop) in enumerate(zip(info["batch_start"], info["batch_stop"]))
+                    if i not in skipped
+                    for j in range(start, stop)
+                ]
+                Q = P
+                for j in indices:
+                    Q = MontCurve.xmul_Ladder(Q, A24, j)
+                with field.counting() as cnt:
+                    R = MontCurve.xmul_public_product(P, A24, indices)
+                self.assertTrue(MontCurve.isequal(Q, R))
+                # Only the strategies the curve was built with
+                costs = [MontCurve.cladder(prod(info["L"][j] for j in indices))]
+                if MontCurve.SDAC:
+                    costs.append(sum(MontCurve.c_xmul[j] for j in indices))
+                if MontCurve.PRAC:
+                    costs.append(sum(MontCurve.cprac(j) for j in indices))
+                cost = min(costs, key=MontCurve.measure)
+                self.assertEqual((cnt.M, cnt.S, cnt.a), tuple(cost))
+
+    def test_cofactor_multiples(self, num_point=2):
+        for field, MontCurve, info in [(Fp1024, MontCurve_p1024, p1024_info), (Fp2048, MontCurve_p2048, p2048_info)]:
+            n = len(info["L"])
+            A24 = (field(2), field(4))
+            for _ in range(num_point):
+                P = (field.get_random(), field(1))
+                lo = get_randint(0, n - 2)
+                hi = get_randint(lo + 1, min(n, lo + 24))
+                multiples = MontCurve.cofactor_multiples(P, A24, lo, hi)
+                self.assertEqual(len(multiples), hi - lo)
+                for i in range(lo, hi):
+                    Q = P
+                    for j in range(lo, hi):
+                        if j != i:
+                            Q = MontCurve.xmul_Ladder(Q, A24, j)
+                    self.assertTrue(MontCurve.isequal(Q, multiples[i - lo]))
+
+    def test_xmul_ladder_many(self):
+        for field, MontCurve, L in [(Fp1024, MontCurve_p1024, p1024_info["L"]), (Fp2048, MontCurve_p2048, p2048_info["L"])]:
+            A24 = (field.get_random(), field(4))
+            # Below and at the size where the points are packed into FpVectors
+            for num_point in [2, MontCurve.BATCH_VECTOR_MIN]:
+                Ps = [(field.get_random(), field.get_random()) for _ in range(num_point)]
+                Ps[1] = (field(3), field(0))
+                i = get_randint(0, len(L) - 1) if num_point == 2 else 0
+                with field.counting() as cnt:
+                    Qs = [MontCurve.xmul_Ladder(P, A24, i) for P in Ps]
+                with field.counting() as cnt_many:
+                    Rs = MontCurve.xmul_ladder_many(Ps, A24, i)
+                self.assertEqual((cnt.M, cnt.S, cnt.a), (cnt_many.M, cnt_many.S, cnt_many.a))
+                self.assertEqual(Rs[1][1], 0)
+                for Q, R in zip(Qs, Rs):
+                    self.assertTrue(MontCurve.isequal(Q, R))
+                for Q, R in zip(MontCurve.xdbl_many(Ps, A24), Ps):
+                    self.assertTrue(MontCurve.isequal(Q, MontCurve.xdbl(R, A24)))
+
+    def test_normalize_many(self, num_point=10):
+        for field, MontCurve in [(Fp1024, MontCurve_p1024), (Fp2048, MontCurve_p2048)]:
+            points = [(field.get_random(), field.get_random()) for _ in range(num_point)]
+            field.reset_power_invert_time()
+            affines = MontCurve.normalize_many(points)
+            self.assertEqual(field.inv_count, 1)
+            self.assertEqual(len(affines), num_point)
+            for P, x in zip(points, affines):
+                self.assertEqual(x.get_int_value(), get_affine_from_projective(P))
+
     def test_issupersingular_original(self, num_randcurve=20):
         # print('Testing is_supersingular_original:')
         for field, sage_Fp, MontCurve, prime_name, L in [
@@ -237,4 +402,109 @@ class TestMontgomeryCurve(unittest.TestCase):
             supersingular_coeffs = load_supersingular_coefficients(prime_name)
             for a in supersingular_coeffs:
                 # print(f'a = {a}')
-                test_one_curve(field(a), True)
\ No newline at end of file
+                test_one_curve(field(a), True)
+
+    def test_validate_original(self, num_randcurve=5):
+        for field, prime_name in [(Fp1024, "p1024_CTIDH"), (Fp2048, "p2048_CTIDH")]:
+            MontCurve = MontgomeryCurve(prime_name)
+            for a in [0] + load_supersingular_coefficients(prime_name)[:num_randcurve]:
+                u = field.get_random()
+                result = MontCurve.validate_original((field(a) * u, u))
+                self.assertIs(result.supersingular, True)
+                self.assertFalse(result.fallback)
+                self.assertGreater(result.xmuls, 0)
+                self.assertLessEqual(result.retries, 4)
+            for _ in range(num_randcurve):
+                result = MontCurve.validate_original((field.get_random(), field(1)), max_retries=0)
+                self.assertIs(result.supersingular, False)  # never None
+            for a in [2, -2]:
+                u = field.get_random()
+                result = MontCurve.validate_original((field(a) * u, u))
+                self.assertIs(result.supersingular, False)
+                self.assertEqual(result.xmuls, 0)
+                self.assertIs(MontCurve.issupersingular_original((field(a), field(1))), False)
+
+    def test_issupersingular_doliskani(self, num_randcurve=20):
+        for field, sage_Fp, prime_name in [
+            (Fp1024, sage_GFp1024, "p1024_CTIDH"),
+            (Fp2048, sage_GFp2048, "p2048_CTIDH"),
+        ]:
+            MontCurve = MontgomeryCurve(prime_name, validation="doliskani")
+            self.assertIs(MontCurve.issupersingular, MontCurve.issupersingular_doliskani)
+
+            def test_one_curve(a=field(0), is_Ea_supersingular=False):
+                u = field.get_random()
+                A = (a*u, u)
+                if is_Ea_supersingular:
+                    sage_is_supersingular = True
+                else:
+                    sage_EC = get_sage_montgomery_curve(sage_Fp, a.get_int_value())
+                    sage_is_supersingular = sage_EC.is_supersingular(proof=False)
+                self.assertEqual(MontCurve.issupersingular_doliskani(A), sage_is_supersingular)
+
+            test_one_curve(a=field(0), is_Ea_supersingular=True)
+            for _ in range(num_randcurve - 1):
+                while True:
+                    a = field.get_random()
+                    if a != 2 and a != -2: # ensure the curve is non-singular
+                        break
+                test_one_curve(a)
+
+            for a in load_supersingular_coefficients(prime_name):
+                test_one_curve(field(a), True)
+
+    def test_issupersingular_pairing(self, num_randcurve=10):
+        for field, sage_Fp, prime_name in [
+            (Fp1024, sage_GFp1024, "p1024_CTIDH"),
+            (Fp2048, sage_GFp2048, "p2048_CTIDH"),
+        ]:
+            for validation in ["pairing1", "pairing2"]:
+                MontCurve = MontgomeryCurve(prime_name, validation=validation)
+                issupersingular = MontCurve[f"issupersingular_{validation}"]
+                self.assertIs(MontCurve.issupersingular, issupersingular)
+
+                u = field.get_random()
+                self.assertTrue(issupersingular((field(0), u)))
+                for a in load_supersingular_coefficients(prime_name):
+                    self.assertTrue(issupersingular((field(a) * u, u)))
+                for _ in range(num_randcurve):
+                    a = field.get_random()
+                    if a == 2 or a == -2:
+                        self.assertFalse(issupersingular((a, field(1))))
+                        continue
+                    sage_EC = get_sage_montgomery_curve(sage_Fp, a.get_int_value())
+                    self.assertEqual(issupersingular((a, field(1))), sage_EC.is_supersingular(proof=False))
+                # At least one ordinary curve is rejected, almost any random a is ordinary
+                while True:
+                    a = field.get_random()
+                    if a != 2 and a != -2:
+                        sage_EC = get_sage_montgomery_curve(sage_Fp, a.get_int_value())
+                        if not sage_EC.is_supersingular(proof=False):
+                            break
+                self.assertIs(issupersingular((a * u, u)), False)
+                # The singular y^2 = x (x +- 1)^2, never an elliptic curve
+                for a in [2, -2]:
+                    self.assertIs(issupersingular((field(a) * u, u)), False)
+                    self.assertIs(issupersingular((field(a), field(1)), max_retries=0), False)
+
+    def test_tate_pairing(self):
+        MontCurve = MontgomeryCurve("p1024_CTIDH", validation="pairing1")
+        field = MontCurve.field
+        a = field(0)
+        m = MontCurve.p + 1
+        P = MontCurve.random_point_with_y(a, False)
+        Q = MontCurve.random_point_with_y(a, True)
+        z = MontCurve.tate_pairing(P, Q, a, m)
+        self.assertEqual(z.norm(), 1)
+        self.assertEqual(z.unitary_pow(m), 1)
+        self.assertNotEqual(z, 1)
+
+        # Bilinearity: e([k]P, Q) = e(P, [k]Q) = e(P, Q)^k. The x-only multiples lose the sign of y, i.e. the
+        # pairing of -[k]P, that is e(P, Q)^-k, the conjugate of e(P, Q)^k
+        A24 = MontCurve.xA24((a, field(1)))
+        for k in [2, 3, 5]:
+            zk = z.unitary_pow(k)
+            Pk = MontCurve.affine_point_with_y(MontCurve.xmul_int((P[0], field(1)), A24, k), a, False)
+            Qk = MontCurve.affine_point_with_y(MontCurve.xmul_int((Q[0], field(1)), A24, k), a, True)
+            self.assertIn(MontCurve.tate_pairing(Pk, Q, a, m), (zk, zk.conjugate()))
+            self.assertIn(MontCurve.tate_pairing(P, Qk, a, m), (zk, zk.conjugate()))
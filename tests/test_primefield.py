@@ -1,10 +1,10 @@
 import unittest
 import json
 
-from sage.all import kronecker_symbol, proof
+from sage.all import kronecker_symbol, proof, GF, PolynomialRing
 
-from CTIDH import PrimeField
-from CTIDH.utils import read_prime_info, get_randint
+from CTIDH import PrimeField, FpVector, Fp2
+from CTIDH.utils import read_prime_info, get_randint, chain_cost, bitlength, hamming_weight, cmov, cswap
 
 proof.arithmetic(False)
 
@@ -216,14 +216,105 @@ class TestPrimeField(unittest.TestCase):
                 self.assertEqual(Fp.pow_count, 1)
                 self.assertEqual(Fp.add_count, 0)
                 self.assertEqual(Fp.mul_count, e_maxbitlen-1)
-                self.assertEqual(Fp.sqr_count, e_maxbitlen-1)
+                self.assertEqual(Fp.sqr_count, e_maxbitlen)
 
                 self.assertEqual(result, a**e)
 
+    def test_safe_pow2(self, num_test=20):
+        for Fp, p in [(Fp1024, p1024), (Fp2048, p2048)]:
+            for _ in range(num_test):
+                a, b = Fp.get_random(), Fp.get_random()
+                e = get_randint(0, 2**12)
+                e_maxbitlen = max(e.bit_length(), 1) + get_randint(0, 3)
+                Fp.reset_runtime()
+                Fp.reset_power_invert_time()
+                result_a, result_b = Fp.safe_pow2(a, b, e, e_maxbitlen)
+                self.assertEqual(Fp.pow_count, 2)
+                self.assertEqual(Fp.mul_count, 2 * (e_maxbitlen-1))
+                self.assertEqual(Fp.sqr_count, 2 * e_maxbitlen)
 
-    def test_invert(self):
-        #TODO
-        pass
+                self.assertEqual(result_a, a**e)
+                self.assertEqual(result_b, b**e)
+
+
+    def test_invert(self, num_test=20):
+        for Fp in [Fp1024, Fp2048]:
+            for mode in ["fermat", "safegcd"]:
+                Fp.set_inversion(mode)
+                for _ in range(num_test):
+                    a = Fp.get_random()
+                    Fp.reset_power_invert_time()
+                    self.assertEqual(~a * a, 1)
+                    self.assertEqual(Fp.inv_count, 1)
+                self.assertEqual(~Fp(1), 1)
+                self.assertEqual(~Fp(-1), -1)
+            Fp.set_inversion("fermat")
+
+        with self.assertRaises(ValueError):
+            Fp1024.set_inversion("euclid")
+        with self.assertRaises(ValueError):
+            Fp1024.set_inversion("safegcd", steps=100)
+
+    def test_batch_invert(self, num_test=20):
+        for Fp in [Fp1024, Fp2048]:
+            elems = [Fp.get_random() for _ in range(num_test)] + [Fp(1), 5]
+            Fp.reset_runtime()
+            ~Fp(3)
+            invert_mul_count = Fp.mul_count
+            Fp.reset_runtime()
+            Fp.reset_power_invert_time()
+            invs = Fp.batch_invert(elems)
+            self.assertEqual(Fp.inv_count, 1)
+            self.assertEqual(Fp.mul_count - invert_mul_count, 3 * (len(elems) - 1))
+            for a, a_inv in zip(elems, invs):
+                self.assertEqual(a_inv * a, 1)
+            self.assertEqual(Fp.batch_invert([]), [])
+            with self.assertRaises(ZeroDivisionError):
+                Fp.batch_invert([Fp(2), Fp(0), Fp(3)])
+
+    def test_fixed_exponent_chains(self, num_test=5):
+        for p, Fp in [(p1024, Fp1024), (p2048, Fp2048)]:
+            for name, e in [("p-2", p - 2), ("(p-1)/2", (p - 1) // 2), ("(p+1)/4", (p + 1) // 4)]:
+                chain = Fp._chains[name]
+                mul, sqr = chain_cost(chain)
+                self.assertLess(mul + sqr, hamming_weight(e) + bitlength(e) - 2)
+                for _ in range(num_test):
+                    a = Fp.get_random()
+                    Fp.reset_runtime()
+                    self.assertEqual(a.pow_chain(chain), a**e)
+                    self.assertEqual(Fp.mul_count, mul + hamming_weight(e) - 1)
+                    self.assertEqual(Fp.sqr_count, sqr + bitlength(e) - 1)
+
+            a = Fp.get_random()
+            Fp.reset_runtime()
+            ~a
+            self.assertEqual((Fp.mul_count, Fp.sqr_count), chain_cost(Fp._chains["p-2"]))
+
+    def test_sqrt(self, num_test=20):
+        for Fp in [Fp1024, Fp2048]:
+            for _ in range(num_test):
+                a = Fp.get_random()
+                b = a**2
+                self.assertIn(b.sqrt(), [a, -a])
+                if not a.is_square():
+                    with self.assertRaises(ValueError):
+                        a.sqrt()
+
+    def test_cmov_cswap(self):
+        for Fp in [Fp1024, PrimeField(p1024, backend="gmpy2")]:
+            a, b, c = Fp.get_random(), Fp.get_random(), Fp.get_random()
+            for control in [False, True, 0, 1]:
+                expected = b if control else a
+                self.assertEqual(cmov(a, b, control), expected)
+                self.assertIsNot(cmov(a, b, control), expected)
+                self.assertEqual(cmov(a, 1, control), 1 if control else a)
+                self.assertEqual(cmov((a, c), (b, 4), control), (b, Fp(4)) if control else (a, c))
+                self.assertEqual(cmov(3, 5, control), 5 if control else 3)
+
+                P, Q = (a, b), (c, Fp(0))
+                self.assertEqual(cswap(P, Q, control), (Q, P) if control else (P, Q))
+                self.assertEqual(cswap(a, b, control), (b, a) if control else (a, b))
+            self.assertEqual((a, b, c), (a, b, c))
 
     def test_random(self, num_test = 50):
         for _ in range(num_test):
@@ -238,6 +329,216 @@ class TestPrimeField(unittest.TestCase):
             a = Fp2048.get_random()
             self.assertEqual(a.is_square(), kronecker_symbol(a.value, p2048) == 1)
 
+    def test_is_square_fast(self, num_test = 50):
+        for p, Fp in [(p1024, Fp1024), (p2048, Fp2048)]:
+            for _ in range(num_test):
+                a = Fp.get_random()
+                Fp.reset_runtime()
+                Fp.reset_power_invert_time()
+                self.assertEqual(a.is_square_fast(), kronecker_symbol(a.value, p) == 1)
+                self.assertEqual((Fp.mul_count, Fp.sqr_count, Fp.pow_count), (1, 1, 0))
+                self.assertEqual((a**2).is_square_fast(), True)
+            self.assertEqual(Fp(0).is_square_fast(), Fp(0).is_square())
+
         for _ in range(num_test):
             a = Fp1024.get_random()
             self.assertEqual(a.is_square(), kronecker_symbol(a.value, p1024) == 1)
+
+
+class TestPrimeFieldGmpy2(unittest.TestCase):
+    """The gmpy2 backend must agree with the sage backend, and count the same way."""
+
+    def test_arithmetic(self, num_test=50):
+        for p, Fp in [(p1024, Fp1024), (p2048, Fp2048)]:
+            Gp = PrimeField(p, backend="gmpy2")
+            for _ in range(num_test):
+                x = get_randint(0, p - 1)
+                y = get_randint(0, p - 1)
+                e = get_randint(3, 2**12)
+                a, b = Fp(x), Fp(y)
+                c, d = Gp(x), Gp(y)
+                self.assertEqual((a + b).get_int_value(), (c + d).get_int_value())
+                self.assertEqual((a - b).get_int_value(), (c - d).get_int_value())
+                self.assertEqual((a * b).get_int_value(), (c * d).get_int_value())
+                self.assertEqual((3 - a).get_int_value(), (3 - c).get_int_value())
+                self.assertEqual((-a).get_int_value(), (-c).get_int_value())
+                self.assertEqual((a**e).get_int_value(), (c**e).get_int_value())
+                self.assertEqual(a.is_square(), c.is_square())
+                self.assertEqual(a.is_square(), c.is_square_fast())
+                if x != 0:
+                    self.assertEqual((a ** (-1)).get_int_value(), (c ** (-1)).get_int_value())
+
+    def test_counting(self):
+        Gp = PrimeField(p1024, backend="gmpy2")
+        Gp.reset_runtime()
+        Gp.reset_power_invert_time()
+        a = Gp(p1024 - 2)
+        b = a + 3
+        b -= 1
+        b = b * a
+        b *= 7
+        b = a**7
+        self.assertEqual(Gp.add_count, 2)
+        self.assertEqual(Gp.mul_count, 2 + 2)
+        self.assertEqual(Gp.sqr_count, 2)
+        self.assertEqual(Gp.pow_count, 1)
+
+    def test_counting_scope(self):
+        Gp = PrimeField(p1024, backend="gmpy2")
+        a, b = Gp(3), Gp(5)
+        total = Gp.mul_count
+        with Gp.counting() as outer:
+            c = a * b + 1
+            with Gp.counting() as inner:
+                c = c**2
+                c = ~c
+        self.assertEqual((outer.M, outer.S, outer.a, outer.P, outer.I), (1 + inner.M, inner.S, 1, inner.P, 1))
+        self.assertEqual((inner.a, inner.I), (0, 1))
+        self.assertEqual(Gp.mul_count - total, outer.M)
+        with self.assertRaises(ValueError):
+            with PrimeField(p1024, backend="gmpy2", counting=False).counting():
+                pass
+
+    def test_attributed(self):
+        Gp = PrimeField(p1024, backend="gmpy2")
+
+        def inner(x):
+            return x**2
+
+        def outer(x):
+            return inner(x) * inner(x + 1)
+
+        inner, outer = Gp.attributed(inner), Gp.attributed(outer)
+        with Gp.counting(by_function=True) as c:
+            outer(Gp(7))
+            inner(Gp(7))
+        self.assertEqual(c.S, 3)
+        self.assertEqual(c.M, 1)
+        self.assertEqual(c.by_function["outer"], {"M": 1, "S": 0, "a": 1, "P": 0, "I": 0, "calls": 1})
+        self.assertEqual(c.by_function["inner"], {"M": 0, "S": 3, "a": 0, "P": 0, "I": 0, "calls": 3})
+        # Outside a by_function scope the wrappers only forward the call
+        self.assertEqual(outer(Gp(2)), 36)
+        self.assertIsNone(Gp._attribution)
+
+    def test_no_counting(self):
+        Gp = PrimeField(p1024, backend="gmpy2", counting=False)
+        self.assertIsNot(Gp, PrimeField(p1024, backend="gmpy2"))
+        a = Gp(5)
+        b = (a + 3) * a - 1
+        b **= 3
+        b = ~b
+        self.assertEqual(b * 39**3, 1)
+        self.assertEqual(Gp.add_count + Gp.mul_count + Gp.sqr_count, 0)
+        self.assertEqual(Gp.pow_count + Gp.inv_count, 0)
+
+
+class TestFpVector(unittest.TestCase):
+    """FpVector must agree entrywise with ZModPrime, and count one Fp-operation per entry."""
+
+    def test_arithmetic(self, n=17):
+        for Fp in [Fp1024, PrimeField(p1024, backend="gmpy2")]:
+            Vp = FpVector(Fp)
+            xs = [Fp.get_random() for _ in range(n)]
+            ys = [Fp.get_random() for _ in range(n)]
+            c = Fp.get_random()
+            u, v = Vp(xs), Vp(ys)
+            self.assertEqual(len(u), n)
+            self.assertEqual((u + v).to_list(), [x + y for x, y in zip(xs, ys)])
+            self.assertEqual((u - v).to_list(), [x - y for x, y in zip(xs, ys)])
+            self.assertEqual((u * v).to_list(), [x * y for x, y in zip(xs, ys)])
+            self.assertEqual((u * c).to_list(), [x * c for x in xs])
+            self.assertEqual((3 - u).to_list(), [3 - x for x in xs])
+            self.assertEqual((u**2).to_list(), [x**2 for x in xs])
+            self.assertEqual(u[n - 1], xs[n - 1])
+            self.assertEqual(u[2:5].to_list(), xs[2:5])
+
+            mask = [i % 3 == 0 for i in range(n)]
+            self.assertEqual(u.cmov(v, mask).to_list(), [y if m else x for x, y, m in zip(xs, ys, mask)])
+
+            prod = Fp(1)
+            for x in xs:
+                prod *= x
+            self.assertEqual(u.prod(), prod)
+            self.assertEqual(Vp([]).prod(), 1)
+
+    def test_blocks(self, n=7, m=3):
+        for Fp in [Fp1024, PrimeField(p1024, backend="gmpy2")]:
+            Vp = FpVector(Fp)
+            xs = [Fp.get_random() for _ in range(n)]
+            u = Vp(xs)
+            self.assertEqual(u.tile(m).to_list(), xs * m)
+            self.assertEqual(u.repeat(m).to_list(), [x for x in xs for _ in range(m)])
+            self.assertEqual(u.tile(m).prod_blocks(m).to_list(), [u.prod()] * m)
+            self.assertEqual(u.repeat(m).prod_blocks(n).to_list(), [x**3 for x in xs])
+            self.assertEqual(Vp([]).prod_blocks(m).to_list(), [1] * m)
+            self.assertEqual(Vp.concatenate([u, u[:2]]).to_list(), xs + xs[:2])
+
+            Fp.reset_runtime()
+            u.tile(m).prod_blocks(m)
+            self.assertEqual(Fp.mul_count, m * (n - 1))
+
+    def test_counting(self, n=11):
+        Fp = Fp1024
+        Vp = FpVector(Fp)
+        u = Vp([Fp.get_random() for _ in range(n)])
+        Fp.reset_runtime()
+        v = u * u
+        v += 1
+        v = v**2
+        v.cmov(u, [True] * n).prod()
+        self.assertEqual(Fp.mul_count, n + n - 1)
+        self.assertEqual(Fp.add_count, n)
+        self.assertEqual(Fp.sqr_count, n)
+
+
+class TestFp2(unittest.TestCase):
+    """Fp2 must agree with Sage's GF(p^2) = GF(p)[i] / (i^2 + 1), and count 3M per product, 2M per square."""
+
+    def test_arithmetic(self, num_test=20):
+        for p, Fp in [(p1024, Fp1024), (p1024, PrimeField(p1024, backend="gmpy2")), (p2048, Fp2048)]:
+            K = Fp2(Fp)
+            R = PolynomialRing(GF(p), "x")
+            sage_K = GF(p**2, "i", modulus=R.gen() ** 2 + 1)
+            sage_i = sage_K.gen()
+            to_sage = lambda z: z.re.get_int_value() + z.im.get_int_value() * sage_i
+            for _ in range(num_test):
+                a, b = K.get_random(), K.get_random()
+                c = Fp.get_random()
+                sa, sb = to_sage(a), to_sage(b)
+                self.assertEqual(to_sage(a + b), sa + sb)
+                self.assertEqual(to_sage(a - b), sa - sb)
+                self.assertEqual(to_sage(3 - a), 3 - sa)
+                self.assertEqual(to_sage(a * b), sa * sb)
+                self.assertEqual(to_sage(a * c), sa * c.get_int_value())
+                self.assertEqual(to_sage(a**2), sa**2)
+                self.assertEqual(to_sage(-a), -sa)
+                self.assertEqual(to_sage(~a), sa ** (-1))
+                self.assertEqual(a.norm(), (sa ** (p + 1)).polynomial()[0])
+                self.assertEqual(a.is_square(), sa.is_square())
+                self.assertEqual(a.is_square_fast(), sa.is_square())
+                self.assertTrue(K(c).is_square())
+                self.assertEqual(a * b, b * a)
+                self.assertNotEqual(a, a + 1)
+
+    def test_counting(self):
+        Fp = PrimeField(p1024, backend="gmpy2")
+        K = Fp2(Fp)
+        a, b, c = K.get_random(), K.get_random(), Fp.get_random()
+        for f, cost in [(lambda: a * b, (3, 0, 5)), (lambda: a**2, (2, 0, 3)), (lambda: a * c, (2, 0, 0))]:
+            with Fp.counting() as cnt:
+                f()
+            self.assertEqual((cnt.M, cnt.S, cnt.a), cost)
+
+    def test_unitary(self, num_test=10):
+        Fp = PrimeField(p1024, backend="gmpy2")
+        K = Fp2(Fp)
+        for _ in range(num_test):
+            a = K.get_random()
+            z = a.conjugate() * ~a  # norm 1
+            self.assertEqual(z.norm(), 1)
+            self.assertEqual(z.unitary_square(), z**2)
+            e = Fp.get_random().get_int_value() % 1000
+            expected = K(Fp(1))
+            for _ in range(e):
+                expected = expected * z
+            self.assertEqual(z.unitary_pow(e), expected)